@@ -0,0 +1,353 @@
+"""Benchmark of the WANO price-list pipeline on synthetic input.
+
+Builds a reproducible ``.xlsm`` workbook (``{n}PL``/``{n}EN`` sheets with a configurable number
+of rows and embedded images) together with matching ``Start``/``End``/layout PDFs, then runs
+``generate_price_lists`` on it in a fresh process per repetition. Sheets are converted by the
+real LibreOffice when one is installed and by a deterministic ``soffice`` stub otherwise (or
+when ``--office stub`` is given), so results from machines without LibreOffice are still
+comparable with each other.
+
+Reported per run: wall time of the export, merge and footer stages (the footer is stamped
+during the merge, so it is included in the merge time as well), the total time, the peak RSS
+of the pipeline and of the office processes, and the size and page count of the output. The
+median over ``--repeat`` runs is compared with a stored baseline; the exit status is 1 when a
+metric regressed by more than ``--tolerance``. ``price_list_baseline.json`` holds a baseline of
+the default configuration with the stub; timings depend on the machine, so record your own with
+``--save-baseline`` before comparing (and for any other configuration)::
+
+    python benchmarks/price_list_bench.py --save-baseline
+    python benchmarks/price_list_bench.py
+    python benchmarks/price_list_bench.py --sheets 12 --rows 200 --images 2 --save-baseline
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENERATOR_PATH = os.path.join(ROOT, "static", "assets", "PDF-generation.py")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "price_list_baseline.json")
+STAGES = ("export", "merge", "footer", "total")
+# Time differences below this are noise, whatever the relative change.
+MIN_TIME_DELTA = 0.05
+ROWS_PER_PAGE = 45
+
+_STUB = '''#!{python}
+"""Deterministic stand-in for `soffice --headless --convert-to pdf --outdir DIR FILE`."""
+import os
+import sys
+
+from openpyxl import load_workbook
+from reportlab.pdfgen import canvas
+
+args = sys.argv[1:]
+outdir = args[args.index("--outdir") + 1]
+source = args[-1]
+target = os.path.join(outdir, os.path.splitext(os.path.basename(source))[0] + ".pdf")
+wb = load_workbook(source)
+pdf = canvas.Canvas(target, pagesize=(595.27, 841.89), invariant=1)
+for ws in wb.worksheets:
+    if ws.sheet_state != "visible":
+        continue
+    rows = list(ws.iter_rows(values_only=True))
+    for start in range(0, max(len(rows), 1), {rows_per_page}):
+        pdf.setFont("Helvetica-Bold", 12)
+        pdf.drawString(40, 800, f"{{ws.title}} ({{start // {rows_per_page} + 1}})")
+        pdf.setFont("Helvetica", 8)
+        for offset, row in enumerate(rows[start:start + {rows_per_page}]):
+            y = 780 - offset * 16
+            for column, value in enumerate(row[:6]):
+                pdf.drawString(40 + column * 90, y, "" if value is None else str(value)[:20])
+        if start == 0:
+            for number, _ in enumerate(ws._images):
+                pdf.rect(400, 700 - number * 110, 150, 100)
+        pdf.showPage()
+pdf.save()
+'''
+
+_CHILD = """
+import importlib.util, json, os, resource, sys, threading, time
+
+config = json.loads(sys.argv[1])
+spec = importlib.util.spec_from_file_location("pdf_generation", config["generator"])
+pdf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(pdf)
+if config["stub"]:
+    pdf._import_uno = lambda: None
+
+intervals = {"export": [], "merge": [], "footer": []}
+lock = threading.Lock()
+
+def timed(stage, fn):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with lock:
+                intervals[stage].append((started, time.perf_counter()))
+    return wrapper
+
+pdf._export_sheet_sets = timed("export", pdf._export_sheet_sets)
+pdf._merge_pdf_list = timed("merge", pdf._merge_pdf_list)
+pdf._FooterStamper.stamp = timed("footer", pdf._FooterStamper.stamp)
+
+def wall(spans):
+    # Languages are merged in parallel: count overlapping intervals once.
+    total, end = 0.0, None
+    for start, stop in sorted(spans):
+        if end is None or start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+started = time.perf_counter()
+outputs = pdf.generate_price_lists(config["languages"], config["excel"])
+total = time.perf_counter() - started
+pdf.shutdown_office_pool()
+
+from PyPDF2 import PdfReader
+scale = 1024 if sys.platform == "darwin" else 1
+result = {stage: wall(spans) for stage, spans in intervals.items()}
+result.update(
+    total=total,
+    rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale / 1024,
+    office_rss_mb=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale / 1024,
+    output_bytes=sum(os.path.getsize(path) for path in outputs.values()),
+    pages=sum(len(PdfReader(path).pages) for path in outputs.values()),
+)
+print(json.dumps(result))
+"""
+
+
+def find_office():
+    for candidate in (os.environ.get("SOFFICE_PATH"), shutil.which("libreoffice"), shutil.which("soffice")):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _write_pdf(path: str, title: str, pages: int):
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(path, pagesize=(595.27, 841.89), invariant=1)
+    for number in range(1, pages + 1):
+        pdf.setFont("Helvetica-Bold", 24)
+        pdf.drawString(60, 760, title)
+        pdf.setFont("Helvetica", 10)
+        for line in range(40):
+            pdf.drawString(60, 720 - line * 16, f"{title} - strona {number}, wiersz {line + 1}")
+        pdf.showPage()
+    pdf.save()
+
+
+def _write_images(directory: str, count: int, size: tuple, seed: int) -> list:
+    from PIL import Image
+
+    rng = random.Random(seed)
+    paths = []
+    for number in range(count):
+        width, height = size
+        # Blocks of noise: compresses like a product photo rather than a flat colour.
+        small = Image.frombytes("RGB", (width // 8, height // 8), rng.randbytes(width // 8 * height // 8 * 3))
+        path = os.path.join(directory, f"image{number}.png")
+        small.resize(size, Image.NEAREST).save(path, "PNG")
+        paths.append(path)
+    return paths
+
+
+def build_inputs(base_dir: str, args) -> str:
+    """Create the workbook and the PDFs of a WANO base directory; returns the workbook path."""
+    from openpyxl import Workbook
+    from openpyxl.drawing.image import Image as SheetImage
+
+    pdfy_dir = os.path.join(base_dir, "pdfy")
+    assets_dir = os.path.join(base_dir, "bench-assets")
+    os.makedirs(pdfy_dir, exist_ok=True)
+    os.makedirs(assets_dir, exist_ok=True)
+    tokens = [language.upper() for language in args.languages]
+
+    for token in tokens:
+        _write_pdf(os.path.join(pdfy_dir, f"Start{token}.pdf"), f"Start {token}", args.start_pages)
+        _write_pdf(os.path.join(pdfy_dir, f"End{token}.pdf"), f"End {token}", 1)
+        for number in range(2, args.sheets + 1):
+            _write_pdf(os.path.join(pdfy_dir, f"{number}{token}.pdf"), f"Układ {number}{token}", args.layout_pages)
+
+    images = _write_images(assets_dir, args.images, args.image_size, args.seed) if args.images else []
+    rng = random.Random(args.seed)
+    wb = Workbook()
+    wb.remove(wb.active)
+    for token in tokens:
+        for number in range(1, args.sheets + 1):
+            ws = wb.create_sheet(f"{number}{token}")
+            ws.append(["Kod", "Nazwa", "Cena netto", "Ilość", "Wartość"])
+            for row in range(2, args.rows + 2):
+                ws.append([
+                    f"WN-{number:03d}-{row:05d}",
+                    f"Produkt {number}.{row} {token}",
+                    round(rng.uniform(1, 999), 2),
+                    rng.randint(1, 500),
+                    f"=C{row}*D{row}",
+                ])
+            for position, image in enumerate(images):
+                ws.add_image(SheetImage(image), f"G{2 + position * 12}")
+
+    excel_path = os.path.join(base_dir, "cenniki", "Cennik Partnera WANO.xlsm")
+    os.makedirs(os.path.dirname(excel_path), exist_ok=True)
+    wb.save(excel_path)
+    return excel_path
+
+
+def write_stub(directory: str) -> str:
+    path = os.path.join(directory, "soffice")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_STUB.format(python=sys.executable, rows_per_page=ROWS_PER_PAGE))
+    os.chmod(path, 0o755)
+    return path
+
+
+def run_once(base_dir: str, excel_path: str, office: str, stub: bool, args) -> dict:
+    for name in ("ex", "cennikiPDF-PL", "cennikiPDF-EN", os.path.join("cache", "ex")):
+        shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+    env = dict(os.environ)
+    env.update(
+        WANO_BASE_DIR=base_dir,
+        WANO_EXCEL_PATH=excel_path,
+        WANO_EXPORT_CACHE="1" if args.export_cache else "0",
+        WANO_EXPORT_MODE=args.export_mode,
+        SOFFICE_PATH=office,
+    )
+    for name in ("WANO_EXPORT_DIR", "WANO_PDFY_DIR", "WANO_OUTPUT_PL_DIR", "WANO_OUTPUT_EN_DIR", "WANO_EXPORT_CACHE_DIR"):
+        env.pop(name, None)
+    if args.workers:
+        env["WANO_EXPORT_WORKERS"] = str(args.workers)
+    config = {"generator": GENERATOR_PATH, "excel": excel_path, "languages": args.languages, "stub": stub}
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD, json.dumps(config)], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed:\n{result.stderr[-4000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: list) -> dict:
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    failures = []
+    for stage in STAGES:
+        before, after = baseline.get(stage), current[stage]
+        if before and after > before * (1 + tolerance) and after - before > MIN_TIME_DELTA:
+            failures.append(f"{stage} {after:.2f} s > baseline {before:.2f} s")
+    before = baseline.get("rss_mb")
+    if before and current["rss_mb"] > before * (1 + tolerance):
+        failures.append(f"peak RSS {current['rss_mb']:.1f} MB > baseline {before:.1f} MB")
+    before = baseline.get("output_bytes")
+    if before and current["output_bytes"] > before * (1 + tolerance):
+        failures.append(f"output {current['output_bytes']} B > baseline {before} B")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sheets", type=int, default=8, help="numbered sheets per language")
+    parser.add_argument("--rows", type=int, default=100, help="data rows per sheet")
+    parser.add_argument("--images", type=int, default=1, help="embedded images per sheet")
+    parser.add_argument("--image-size", type=lambda value: tuple(int(part) for part in value.split("x")), default=(800, 600))
+    parser.add_argument("--start-pages", type=int, default=4, help="pages of Start*.pdf (the footer starts on page 5)")
+    parser.add_argument("--layout-pages", type=int, default=1, help="pages of each layout PDF")
+    parser.add_argument("--languages", nargs="+", choices=["pl", "en"], default=["pl", "en"])
+    parser.add_argument("--office", choices=["auto", "real", "stub"], default="auto")
+    parser.add_argument("--export-mode", choices=["single", "per-sheet"], default="single")
+    parser.add_argument("--export-cache", action="store_true", help="keep the export cache between runs (warm runs)")
+    parser.add_argument("--workers", type=int, help="WANO_EXPORT_WORKERS for the runs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="keep the generated inputs here instead of a temporary directory")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this result as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    office = find_office() if args.office != "stub" else None
+    if args.office == "real" and office is None:
+        print("LibreOffice not found (set SOFFICE_PATH)", file=sys.stderr)
+        return 2
+
+    base_dir = args.workdir or tempfile.mkdtemp(prefix="wano-bench-")
+    try:
+        os.makedirs(base_dir, exist_ok=True)
+        excel_path = build_inputs(base_dir, args)
+        stub = office is None
+        if stub:
+            office = write_stub(base_dir)
+        runs = [run_once(base_dir, excel_path, office, stub, args) for _ in range(max(1, args.repeat))]
+    finally:
+        if not args.workdir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    config = {
+        "office": "stub" if stub else "libreoffice",
+        "sheets": args.sheets,
+        "rows": args.rows,
+        "images": args.images,
+        "image_size": list(args.image_size),
+        "start_pages": args.start_pages,
+        "layout_pages": args.layout_pages,
+        "languages": args.languages,
+        "export_mode": args.export_mode,
+        "export_cache": args.export_cache,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+    current = summarize(runs)
+
+    baseline = None
+    failures = []
+    if not os.path.exists(args.baseline) and not args.save_baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline first. Not compared.", file=sys.stderr)
+    elif not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("config") == config:
+            baseline = stored["result"]
+            failures = compare(current, baseline, args.tolerance)
+        else:
+            print("Baseline was recorded with a different configuration; not compared.", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps({"config": config, "result": current, "runs": runs, "baseline": baseline, "failures": failures}, indent=2))
+    else:
+        print(f"{config['office']}, {args.sheets} sheets x {len(args.languages)} languages, {args.rows} rows, "
+              f"{args.images} images per sheet, median of {len(runs)} runs")
+        for stage in STAGES:
+            line = f"  {stage:<7} {current[stage]:8.3f} s"
+            if baseline and baseline.get(stage):
+                line += f"  ({(current[stage] / baseline[stage] - 1) * 100:+.1f}% vs baseline)"
+            print(line)
+        print(f"  peak RSS {current['rss_mb']:.1f} MB (office {current['office_rss_mb']:.1f} MB)")
+        print(f"  output   {current['output_bytes'] / 1024:.1f} KB, {current['pages']:.0f} pages")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "result": current}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Import-time and memory report for starting the app.
+
+Imports ``main`` in a fresh interpreter under ``-X importtime`` and reports the total import
+time, the slowest modules (cumulative) and the peak RSS of that process. Exits with status 1
+when a budget is exceeded or when a module listed in ``--forbid`` was imported, so it can be
+run in CI to catch startup regressions::
+
+    python benchmarks/startup_report.py --max-ms 2500 --max-rss-mb 150
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The PDF generator's dependencies must only load on first WANO use.
+DEFAULT_FORBIDDEN = ("PyPDF2", "reportlab", "openpyxl", "pdf_generation")
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+_CHILD = """
+import json, resource, sys
+import main
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss //= 1024
+print(json.dumps({"rss_kb": rss, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{result.stderr[-4000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us), "depth": len(indent) // 2})
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["imports"] = imports
+    report["total_ms"] = sum(item["self_us"] for item in imports) / 1000
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--max-ms", type=float, help="fail when the total import time exceeds this")
+    parser.add_argument("--max-rss-mb", type=float, help="fail when the peak RSS exceeds this")
+    parser.add_argument("--forbid", nargs="*", default=list(DEFAULT_FORBIDDEN), help="modules that must not be imported")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Nothing should start in the background while measuring.
+    env.setdefault("WANO_OFFICE_PREWARM", "0")
+    env.setdefault("LLM_PRELOAD", "0")
+    report = measure(env)
+
+    loaded = set(report["modules"])
+    forbidden = sorted(
+        name for name in args.forbid if name in loaded or any(module.startswith(name + ".") for module in loaded)
+    )
+    rss_mb = report["rss_kb"] / 1024
+    slowest = sorted(report["imports"], key=lambda item: item["cumulative_us"], reverse=True)[: args.top]
+
+    if args.json:
+        print(json.dumps({"total_ms": report["total_ms"], "rss_mb": rss_mb, "forbidden": forbidden, "slowest": slowest}, indent=2))
+    else:
+        print(f"import time: {report['total_ms']:.0f} ms, peak RSS: {rss_mb:.1f} MB, modules: {len(loaded)}")
+        for item in slowest:
+            print(f"  {item['cumulative_us'] / 1000:8.1f} ms  {'  ' * item['depth']}{item['module']}")
+
+    failures = []
+    if forbidden:
+        failures.append(f"imported at startup: {', '.join(forbidden)}")
+    if args.max_ms is not None and report["total_ms"] > args.max_ms:
+        failures.append(f"import time {report['total_ms']:.0f} ms > {args.max_ms:.0f} ms")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.1f} MB > {args.max_rss_mb:.1f} MB")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
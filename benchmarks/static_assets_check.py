@@ -0,0 +1,78 @@
+"""Smoke check of the fingerprinted static asset URLs.
+
+Builds the asset manifest for ``static/`` into a temporary cache directory, mounts it the way
+``main`` does and requests the fingerprinted URL of a stylesheet and a script through
+Starlette's TestClient. Each asset must answer GET and HEAD with 200, ``Cache-Control:
+immutable`` and the negotiated ``Content-Encoding``, and a repeated request with its ETag must
+get 304. Exits with status 1 on any failure, so it can run in CI after dependency upgrades::
+
+    python benchmarks/static_assets_check.py
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.routing import Mount  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+
+from static_assets import AssetManifest, AssetStaticFiles  # noqa: E402
+
+DEFAULT_ASSETS = ("assets/css/main.css", "assets/js/main.js")
+
+
+def check(client: TestClient, manifest: AssetManifest, rel: str) -> list:
+    failures = []
+    url = manifest.url(rel)
+    if url.endswith("/" + rel):
+        return [f"{rel}: not fingerprinted ({url})"]
+    for method in ("GET", "HEAD"):
+        response = client.request(method, url, headers={"Accept-Encoding": "gzip"})
+        label = f"{method} {url}"
+        if response.status_code != 200:
+            failures.append(f"{label}: status {response.status_code}")
+            continue
+        if "immutable" not in response.headers.get("cache-control", ""):
+            failures.append(f"{label}: Cache-Control is {response.headers.get('cache-control')!r}")
+        if response.headers.get("content-encoding") != "gzip":
+            failures.append(f"{label}: Content-Encoding is {response.headers.get('content-encoding')!r}")
+        etag = response.headers.get("etag")
+        if not etag:
+            failures.append(f"{label}: no ETag")
+            continue
+        revalidated = client.request(method, url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        if revalidated.status_code != 304:
+            failures.append(f"{label} with If-None-Match: status {revalidated.status_code}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("assets", nargs="*", default=list(DEFAULT_ASSETS), help="paths relative to static/")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="static-check-") as cache_dir:
+        manifest = AssetManifest(os.path.join(ROOT, "static"), cache_dir=cache_dir)
+        manifest.build()
+        app = Starlette(
+            routes=[Mount("/static", AssetStaticFiles(directory=manifest.directory, manifest=manifest), name="static")]
+        )
+        failures = []
+        with TestClient(app) as client:
+            for rel in args.assets:
+                failures.extend(check(client, manifest, rel))
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if not failures:
+        print(f"ok: {len(args.assets)} fingerprinted assets")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
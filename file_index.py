@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover - optional dependency
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class FileEntry(NamedTuple):
+    name: str
+    path: str
+    size: int
+    mtime: float
+
+    @property
+    def ext(self) -> str:
+        return self.name.rsplit(".", 1)[-1].lower() if "." in self.name else ""
+
+
+class DirectoryIndex:
+    """In-memory listing of the regular files in one directory.
+
+    Dotfiles are left out: they are the temporary files of in-progress writes (uploads, merges)
+    and must never be listed or served as the latest file.
+
+    The app's own write paths report changes through ``touch``/``discard``. Changes made by
+    other processes are picked up either from filesystem events (when ``watchdog`` is installed
+    and ``watch_directories`` is running) or from the directory's mtime, which is checked at most
+    once per ``check_interval`` seconds; a full rescan also happens every ``rescan_interval``
+    seconds to catch in-place rewrites that leave the directory mtime alone. Derived views are
+    cached until the next change, so repeated listings do no filesystem work at all.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0, rescan_interval: float = 300.0):
+        self.path = os.path.abspath(path)
+        self.check_interval = check_interval
+        self.rescan_interval = rescan_interval
+        self.watched = False
+        self._lock = threading.RLock()
+        self._entries: Dict[str, FileEntry] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        self._checked = 0.0
+        self._scanned = 0.0
+        self._version = 0
+        self._views: Dict[Hashable, object] = {}
+
+    @property
+    def version(self) -> int:
+        self._ensure_fresh()
+        return self._version
+
+    def _changed(self):
+        self._version += 1
+        self._views.clear()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._scanned and self.watched and now - self._scanned < self.rescan_interval:
+                return
+            if self._scanned and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            try:
+                dir_mtime_ns = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                if self._entries or self._dir_mtime_ns is not None:
+                    self._entries = {}
+                    self._dir_mtime_ns = None
+                    self._changed()
+                self._scanned = now
+                return
+            if dir_mtime_ns != self._dir_mtime_ns or now - self._scanned >= self.rescan_interval:
+                self._rescan(dir_mtime_ns, now)
+
+    def _rescan(self, dir_mtime_ns: int, now: float):
+        entries: Dict[str, FileEntry] = {}
+        try:
+            with os.scandir(self.path) as iterator:
+                for item in iterator:
+                    if item.name.startswith("."):
+                        continue
+                    try:
+                        if not item.is_file():
+                            continue
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries[item.name] = FileEntry(item.name, os.path.join(self.path, item.name), stat.st_size, stat.st_mtime)
+        except FileNotFoundError:
+            entries = {}
+        self._dir_mtime_ns = dir_mtime_ns
+        self._scanned = now
+        if entries != self._entries:
+            self._entries = entries
+            self._changed()
+
+    def touch(self, name: str):
+        """Re-read one file after it was created or rewritten (or drop it if it is gone)."""
+        name = os.path.basename(name)
+        if name.startswith("."):
+            return
+        path = os.path.join(self.path, name)
+        try:
+            stat = os.stat(path)
+            entry = FileEntry(name, path, stat.st_size, stat.st_mtime) if os.path.isfile(path) else None
+        except FileNotFoundError:
+            entry = None
+        with self._lock:
+            if entry is None:
+                if self._entries.pop(name, None) is not None:
+                    self._changed()
+            elif self._entries.get(name) != entry:
+                self._entries[name] = entry
+                self._changed()
+
+    def discard(self, name: str):
+        with self._lock:
+            if self._entries.pop(os.path.basename(name), None) is not None:
+                self._changed()
+
+    def names(self) -> List[str]:
+        self._ensure_fresh()
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, name: str) -> Optional[FileEntry]:
+        self._ensure_fresh()
+        with self._lock:
+            return self._entries.get(name)
+
+    def view(self, key: Hashable, build: Callable[[List[FileEntry]], object]):
+        """Return ``build(entries)``, cached until the directory changes."""
+        self._ensure_fresh()
+        with self._lock:
+            if key not in self._views:
+                self._views[key] = build(list(self._entries.values()))
+            return self._views[key]
+
+    def sorted(self, exts: Iterable[str], key: Callable[[FileEntry], object], reverse: bool = False) -> List[FileEntry]:
+        exts = frozenset(ext.lower() for ext in exts)
+        return self.view(
+            ("sorted", exts, key, reverse),
+            lambda entries: sorted((entry for entry in entries if entry.ext in exts), key=key, reverse=reverse),
+        )
+
+    def latest(self, exts: Iterable[str]) -> Optional[FileEntry]:
+        exts = frozenset(ext.lower() for ext in exts)
+
+        def build(entries: List[FileEntry]) -> Optional[FileEntry]:
+            matching = [entry for entry in entries if entry.ext in exts]
+            return max(matching, key=lambda entry: entry.mtime) if matching else None
+
+        return self.view(("latest", exts), build)
+
+
+class _IndexEventHandler(FileSystemEventHandler):
+    def __init__(self, index: DirectoryIndex):
+        self.index = index
+
+    def on_any_event(self, event):
+        if getattr(event, "is_directory", False):
+            return
+        for attr in ("src_path", "dest_path"):
+            path = getattr(event, attr, None)
+            if path and os.path.dirname(os.path.abspath(path)) == self.index.path:
+                self.index.touch(os.path.basename(path))
+
+
+def watch_directories(indexes: Iterable[DirectoryIndex]):
+    """Keep the indexes current from filesystem events; returns the observer, or None without watchdog."""
+    if Observer is None:
+        return None
+    observer = Observer()
+    scheduled = []
+    for index in indexes:
+        if not os.path.isdir(index.path):
+            continue
+        observer.schedule(_IndexEventHandler(index), index.path, recursive=False)
+        scheduled.append(index)
+    if not scheduled:
+        return None
+    observer.daemon = True
+    observer.start()
+    for index in scheduled:
+        index.watched = True
+    return observer
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+STANDARD_WIDTHS = (320, 640, 960, 1280, 1920)
+_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+class ImageVariants:
+    """Resized JPEG/PNG/WebP copies of the images in a static directory, generated on demand.
+
+    Only the ``widths`` below an image's own width (plus the original width, for a plain
+    re-encode) are produced, so URLs cannot be used to fill the cache with arbitrary sizes.
+    A standard width at or above the image's own width maps to that original-width re-encode,
+    so stylesheets can reference e.g. ``/img/1920/...`` without knowing the source size.
+    Variants are keyed by source path, mtime, size, width and format; a changed source gets
+    new files and the old ones age out. The cache directory is trimmed to ``max_bytes`` by
+    deleting the least recently served variants. Without Pillow the original file is served.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        cache_dir: str,
+        widths: Tuple[int, ...] = STANDARD_WIDTHS,
+        max_bytes: int = 200 * 1024 * 1024,
+        quality: int = 80,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.cache_dir = cache_dir
+        self.widths = tuple(sorted(set(widths)))
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._sizes: Dict[str, Tuple[int, int, int]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._cache_bytes: Optional[int] = None
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def source(self, rel: str) -> Optional[str]:
+        path = os.path.abspath(os.path.join(self.directory, rel))
+        if not path.startswith(self.directory + os.sep):
+            return None
+        if os.path.splitext(path)[1].lower() not in SOURCE_EXTENSIONS or not os.path.isfile(path):
+            return None
+        return path
+
+    def dimensions(self, rel: str) -> Optional[Tuple[int, int]]:
+        path = self.source(rel)
+        if path is None or Image is None:
+            return None
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = self._sizes.get(rel)
+        if cached and cached[0] == mtime_ns:
+            return cached[1], cached[2]
+        try:
+            with Image.open(path) as img:
+                width, height = img.size
+                if _rotated(img):
+                    width, height = height, width
+        except Exception as exc:
+            logger.warning("Cannot read image %s: %s", rel, exc)
+            return None
+        self._sizes[rel] = (mtime_ns, width, height)
+        return width, height
+
+    def widths_for(self, rel: str) -> List[int]:
+        size = self.dimensions(rel)
+        if size is None:
+            return []
+        return [width for width in self.widths if width < size[0]] + [size[0]]
+
+    def output_format(self, rel: str, webp: bool) -> str:
+        if webp:
+            return "webp"
+        return "png" if rel.lower().endswith(".png") else "jpeg"
+
+    def media_type(self, fmt: str) -> str:
+        return _MEDIA_TYPES[fmt]
+
+    def variant(self, rel: str, width: int, fmt: str) -> Optional[str]:
+        """Path of ``rel`` resized to ``width`` in ``fmt``; the original when Pillow is missing."""
+        path = self.source(rel)
+        if path is None:
+            return None
+        if Image is None:
+            return path
+        allowed = self.widths_for(rel)
+        if not allowed:
+            return None
+        if width in self.widths and width > allowed[-1]:
+            width = allowed[-1]
+        if width not in allowed:
+            return None
+
+        stat = os.stat(path)
+        raw = f"{rel}|{stat.st_mtime_ns}|{stat.st_size}|{width}|{fmt}|{self.quality}"
+        target = os.path.join(self.cache_dir, f"{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]}.{fmt}")
+        with self._guard:
+            lock = self._locks.setdefault(target, threading.Lock())
+        with lock:
+            if os.path.exists(target):
+                # Mark the hit in atime; mtime stays put because it feeds the ETag.
+                try:
+                    os.utime(target, (time.time(), os.stat(target).st_mtime))
+                except OSError:
+                    pass
+                return target
+            self._render(path, target, width, fmt)
+        with self._guard:
+            self._locks.pop(target, None)
+        self._account(os.path.getsize(target))
+        return target
+
+    def _render(self, path: str, target: str, width: int, fmt: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img)
+            if width < img.width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            elif fmt == "webp" and img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+            tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if fmt == "jpeg":
+                img.save(tmp_path, "JPEG", quality=self.quality, optimize=True, progressive=True)
+            elif fmt == "webp":
+                img.save(tmp_path, "WEBP", quality=self.quality, method=4)
+            else:
+                img.save(tmp_path, "PNG", optimize=True)
+        os.replace(tmp_path, target)
+
+    def _account(self, added: int):
+        with self._guard:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(size for _, size, _ in self._cache_files())
+            else:
+                self._cache_bytes += added
+            if self._cache_bytes <= self.max_bytes:
+                return
+            # Trim to 80% so that eviction does not run again on the very next write.
+            files = sorted(self._cache_files(), key=lambda item: item[2])
+            total = sum(size for _, size, _ in files)
+            for path, size, _ in files:
+                if total <= self.max_bytes * 0.8:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    total -= size
+                except OSError as exc:
+                    logger.warning("Cannot evict image variant %s: %s", path, exc)
+            self._cache_bytes = total
+
+    def _cache_files(self) -> List[Tuple[str, int, float]]:
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as iterator:
+                for item in iterator:
+                    if item.is_file() and not item.name.endswith(".tmp"):
+                        stat = item.stat()
+                        files.append((item.path, stat.st_size, stat.st_atime))
+        except FileNotFoundError:
+            pass
+        return files
+
+
+def _rotated(img) -> bool:
+    try:
+        return img.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+    except Exception:
+        return False
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from state import MemoryStateBackend, StateBackend
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATUSES = {DONE, FAILED, CANCELLED}
+
+_NAMESPACE = "jobs"
+_RECORD_FIELDS = (
+    "id",
+    "language",
+    "source",
+    "key",
+    "languages",
+    "status",
+    "created",
+    "started",
+    "finished",
+    "result",
+    "error",
+    "cancel_requested",
+    "owner",
+    "heartbeat",
+)
+
+
+class Job:
+    """Snapshot of one generation job; ``cancel_event`` is handed to the runner."""
+
+    def __init__(self, language: str, source: str, key: list, languages: Iterable[str]):
+        self.id = uuid.uuid4().hex
+        self.language = language
+        self.source = source
+        self.key = list(key)
+        self.languages = sorted(languages)
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+        self.owner: Optional[str] = None
+        self.heartbeat: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        job = cls.__new__(cls)
+        for field in _RECORD_FIELDS:
+            setattr(job, field, record.get(field))
+        job.cancel_requested = bool(job.cancel_requested)
+        job.cancel_event = threading.Event()
+        if job.cancel_requested:
+            job.cancel_event.set()
+        return job
+
+    def to_record(self) -> dict:
+        return {field: getattr(self, field) for field in _RECORD_FIELDS}
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "language": self.language,
+            "source": os.path.basename(self.source),
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded worker pool running generation jobs in submission order.
+
+    Job records live in a StateBackend, so with a shared backend every uvicorn worker process
+    sees the same queue: any process can submit, inspect or cancel a job, and idle workers of
+    any process claim queued jobs. Jobs whose languages overlap never run at the same time (they
+    share export and output files). Submitting a job with the same ``key`` as a queued or running
+    one returns that job instead of a duplicate. Running jobs send heartbeats; a job whose process
+    died is marked failed once its heartbeat is older than ``stale_after`` seconds.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Job], dict],
+        backend: Optional[StateBackend] = None,
+        workers: int = 2,
+        history: int = 50,
+        poll_interval: float = 0.5,
+        stale_after: float = 60.0,
+        stale_message: str = "Worker process stopped responding",
+    ):
+        self.runner = runner
+        self.backend = backend or MemoryStateBackend()
+        self.workers = max(1, workers)
+        self.history = max(1, history)
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.stale_message = stale_message
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._cond = threading.Condition()
+        self._local: Dict[str, Job] = {}
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._wakeups = 0
+
+    def start(self):
+        with self._cond:
+            if self._threads or self._stopping:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"wano-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            monitor = threading.Thread(target=self._monitor, name="wano-job-monitor", daemon=True)
+            monitor.start()
+            self._threads.append(monitor)
+
+    def _records(self) -> List[dict]:
+        return sorted(self.backend.items(_NAMESPACE).values(), key=lambda record: record["created"])
+
+    def _save(self, job: Job):
+        self.backend.set(_NAMESPACE, job.id, job.to_record())
+
+    def submit(
+        self,
+        language: str,
+        source: str,
+        key: list,
+        languages: Iterable[str],
+        on_created: Optional[Callable[[Job], None]] = None,
+    ) -> Tuple[Job, bool]:
+        """Queue a job; returns (job, created) where created is False for a deduplicated submit.
+
+        ``on_created`` runs for a new job before any worker can claim it.
+        """
+        if self._stopping:
+            raise RuntimeError("Job queue is shutting down")
+        key = list(key)
+        with self.backend.lock(_NAMESPACE):
+            records = self._records()
+            for record in records:
+                if record["status"] not in FINAL_STATUSES and record["key"] == key and not record["cancel_requested"]:
+                    return Job.from_record(record), False
+            job = Job(language, source, key, languages)
+            if on_created is not None:
+                on_created(job)
+            self._save(job)
+            self._trim_history(records)
+        self.start()
+        self._wake()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        record = self.backend.get(_NAMESPACE, job_id)
+        return Job.from_record(record) if record else None
+
+    def jobs(self, active_only: bool = False) -> List[Job]:
+        jobs = [Job.from_record(record) for record in self._records()]
+        if active_only:
+            jobs = [job for job in jobs if not job.is_finished]
+        return list(reversed(jobs))
+
+    def position(self, job: Job) -> Optional[int]:
+        if job.status != QUEUED:
+            return None
+        queued = [record["id"] for record in self._records() if record["status"] == QUEUED]
+        return queued.index(job.id) if job.id in queued else None
+
+    def cancel(self, job_id: str, reason: str) -> Optional[Job]:
+        with self.backend.lock(_NAMESPACE):
+            record = self.backend.get(_NAMESPACE, job_id)
+            if record is None:
+                return None
+            job = Job.from_record(record)
+            if job.is_finished:
+                return job
+            job.cancel_requested = True
+            job.error = job.error or reason
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished = time.time()
+            self._save(job)
+
+        local = self._local.get(job_id)
+        if local is not None:
+            local.cancel_event.set()
+        return job
+
+    def cancel_language(self, language: str, reason: str) -> List[Job]:
+        """Cancel every active job submitted for ``language`` or covering it among its languages."""
+        targets = [
+            job for job in self.jobs(active_only=True) if job.language == language or language in job.languages
+        ]
+        for job in targets:
+            self.cancel(job.id, reason)
+        return targets
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Poll until the job finishes or ``timeout`` passes; returns the latest snapshot."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            job = await asyncio.to_thread(self.get, job_id)
+            if job is None or job.is_finished:
+                return job
+            delay = self.poll_interval
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return job
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+
+    def shutdown(self, reason: str = "Server shutdown"):
+        """Stop the workers; jobs running in this process are cancelled, queued ones stay queued."""
+        with self._cond:
+            self._stopping = True
+            local_ids = list(self._local)
+            self._cond.notify_all()
+            threads = list(self._threads)
+        for job_id in local_ids:
+            self.cancel(job_id, reason)
+        if not self.backend.shared:
+            for job in self.jobs(active_only=True):
+                self.cancel(job.id, reason)
+        for thread in threads:
+            thread.join(timeout=30)
+
+    def _claim(self) -> Optional[Job]:
+        with self.backend.lock(_NAMESPACE):
+            now = time.time()
+            busy = set()
+            records = self._records()
+            for record in records:
+                if record["status"] != RUNNING:
+                    continue
+                if now - (record["heartbeat"] or record["started"] or now) > self.stale_after:
+                    job = Job.from_record(record)
+                    job.status, job.error, job.finished = FAILED, self.stale_message, now
+                    self._save(job)
+                    logger.error("Job %s lost its worker (%s)", job.id, job.owner)
+                    continue
+                busy.update(record["languages"])
+
+            for record in records:
+                if record["status"] == QUEUED and not busy.intersection(record["languages"]):
+                    job = Job.from_record(record)
+                    job.status, job.started, job.heartbeat, job.owner = RUNNING, now, now, self.owner
+                    self._save(job)
+                    self._local[job.id] = job
+                    return job
+        return None
+
+    def _wake(self):
+        with self._cond:
+            self._wakeups += 1
+            self._cond.notify_all()
+
+    def _work(self):
+        while not self._stopping:
+            with self._cond:
+                seen = self._wakeups
+            job = self._claim()
+            if job is None:
+                with self._cond:
+                    # Skip the wait if a submit or a finished job arrived while we were claiming.
+                    if not self._stopping and self._wakeups == seen:
+                        self._cond.wait(self.poll_interval)
+                continue
+
+            status, result, error = DONE, None, None
+            try:
+                result = self.runner(job)
+            except Exception as exc:
+                status = CANCELLED if job.cancel_event.is_set() else FAILED
+                error = str(exc) or exc.__class__.__name__
+                if status == FAILED:
+                    logger.error("Job %s failed: %s", job.id, exc)
+
+            with self.backend.lock(_NAMESPACE):
+                record = self.backend.get(_NAMESPACE, job.id) or job.to_record()
+                final = Job.from_record(record)
+                if status == CANCELLED and final.error:
+                    error = final.error
+                final.status, final.result, final.finished = status, result, time.time()
+                final.error = None if status == DONE else error
+                self._save(final)
+            self._local.pop(job.id, None)
+            self._wake()
+
+    def _monitor(self):
+        # Heartbeats for jobs running here, and cancel requests made through other processes.
+        while not self._stopping or self._local:
+            for job_id, job in list(self._local.items()):
+                with self.backend.lock(_NAMESPACE):
+                    record = self.backend.get(_NAMESPACE, job_id)
+                    if record is None or record["status"] != RUNNING:
+                        continue
+                    if record["cancel_requested"]:
+                        job.cancel_event.set()
+                    record["heartbeat"] = time.time()
+                    self.backend.set(_NAMESPACE, job_id, record)
+            with self._cond:
+                self._cond.wait(self.poll_interval)
+
+    def _trim_history(self, records: List[dict]):
+        finished = [record["id"] for record in records if record["status"] in FINAL_STATUSES]
+        for job_id in finished[: max(0, len(finished) - self.history)]:
+            self.backend.delete(_NAMESPACE, job_id)
@@ -0,0 +1,678 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """Raised when the LLM backend call fails; carries the HTTP status to report."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class LLMBusyError(LLMError):
+    """Raised when the per-model queue is full (backpressure)."""
+
+    def __init__(self, model: str):
+        super().__init__(503, f"Model {model} is busy, try again shortly")
+        self.model = model
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    """Parse "model=N,other=M" into a dict of per-model concurrency limits."""
+    limits: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        name, sep, value = item.strip().rpartition("=")
+        if not sep or not name:
+            continue
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            logger.warning("Ignoring invalid LLM concurrency entry: %s", item)
+    return limits
+
+
+def normalize_model_name(name: str) -> str:
+    """Ollama reports untagged models as "<name>:latest"."""
+    name = name.strip()
+    return name if ":" in name else f"{name}:latest"
+
+
+def extract_completion_text(model_response: dict) -> Optional[str]:
+    """Support both OpenAI-style responses (choices) and Ollama's /api/generate payloads."""
+    choices = model_response.get("choices", [])
+    if choices:
+        choice = choices[0]
+        text = choice.get("text")
+        if not text:
+            # Some providers send chat choices instead of plain text completions.
+            text = choice.get("message", {}).get("content")
+        if text:
+            return text.strip()
+
+    if "response" in model_response:
+        return model_response["response"].strip()
+    return None
+
+
+def parse_stream_line(line: str) -> Tuple[str, bool]:
+    """Return (token, done) for one line of an Ollama NDJSON or OpenAI-style SSE stream."""
+    line = line.strip()
+    if line.startswith("data:"):
+        line = line[5:].strip()
+        if line == "[DONE]":
+            return "", True
+    if not line:
+        return "", False
+
+    chunk = json.loads(line)
+    if chunk.get("error"):
+        raise LLMError(500, "Model response error")
+
+    choices = chunk.get("choices", [])
+    if choices:
+        choice = choices[0]
+        text = choice.get("text")
+        if text is None:
+            text = (choice.get("delta") or {}).get("content")
+        return text or "", bool(choice.get("finish_reason"))
+
+    return chunk.get("response") or "", bool(chunk.get("done"))
+
+
+_STREAM_END = object()
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return _WHITESPACE_RE.sub(" ", prompt).strip()
+
+
+class ResponseCache:
+    """Persistent LRU cache of LLM completions stored in SQLite.
+
+    Entries are keyed by model, normalised prompt and temperature, expire after ``ttl`` seconds
+    and the least recently used ones are evicted once more than ``max_entries`` are stored.
+    Calls are blocking; async callers should run them in a worker thread.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float) -> str:
+        raw = json.dumps([model, normalize_prompt(prompt), round(float(temperature), 3)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str, temperature: float) -> Optional[str]:
+        key = self.make_key(model, prompt, temperature)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, model: str, prompt: str, temperature: float, response: str):
+        key = self.make_key(model, prompt, temperature)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, model, response, now, now),
+                )
+                self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TokenStream:
+    """Async iterator over the tokens of one streamed completion.
+
+    Owns the upstream response and the model slot; both are released by ``aclose`` or when the
+    stream ends, whichever comes first, even if iteration never started.
+    """
+
+    def __init__(self, response: requests.Response, release: Callable[[], None], executor: ThreadPoolExecutor):
+        self._response = response
+        self._release = release
+        self._executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._stop = threading.Event()
+        self._started = False
+        self._closed = False
+
+    def __aiter__(self) -> "TokenStream":
+        return self
+
+    def _start_reader(self):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = self._stop
+        response = self._response
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # Event loop already closed; nobody is listening any more.
+                stop.set()
+
+        def pump():
+            try:
+                for raw in response.iter_lines():
+                    if stop.is_set():
+                        break
+                    if raw:
+                        put(raw.decode("utf-8", errors="replace"))
+            except Exception as exc:
+                if not stop.is_set():
+                    put(exc)
+            finally:
+                put(_STREAM_END)
+
+        self._queue = queue
+        loop.run_in_executor(self._executor, pump)
+
+    async def __anext__(self) -> str:
+        if self._closed:
+            raise StopAsyncIteration
+        if self._queue is None:
+            self._start_reader()
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    logger.error("LLM stream interrupted: %s", item)
+                    raise LLMError(500, "Internal Server Error") from item
+                try:
+                    token, done = parse_stream_line(item)
+                except ValueError as exc:
+                    logger.error("Invalid LLM stream chunk: %s", item)
+                    raise LLMError(500, "Invalid response format") from exc
+                if not self._started:
+                    # Match the stripped output of generate().
+                    token = token.lstrip()
+                    self._started = bool(token)
+                if done:
+                    await self.aclose()
+                    if token:
+                        return token
+                    break
+                if token:
+                    return token
+        except BaseException:
+            await self.aclose()
+            raise
+        await self.aclose()
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        # Closing the response unblocks the reader thread when the client went away mid-stream.
+        self._response.close()
+        self._release()
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.prompts: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class _ModelLimiter:
+    def __init__(self, concurrency: int, max_queue: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.active = 0
+
+
+class LLMClient:
+    """Non-blocking client for the local LLM endpoint.
+
+    Requests go through one pooled keep-alive session on a dedicated thread pool, so the event
+    loop never waits on the socket. Each model has its own concurrency limit; callers beyond the
+    limit queue up to ``max_queue`` deep and are rejected with LLMBusyError after that.
+
+    Identical concurrent ``generate`` calls are coalesced into one upstream request. With a
+    ``batch_window`` (seconds) set, distinct prompts for the same model and temperature that arrive
+    within the window are sent as one prompt list; this only applies to OpenAI-style completion
+    endpoints, since Ollama's /api/generate takes a single prompt.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float,
+        default_concurrency: int = 2,
+        model_limits: Optional[Dict[str, int]] = None,
+        max_queue: int = 16,
+        queue_timeout: Optional[float] = None,
+        batch_window: float = 0.0,
+        batch_max_size: int = 8,
+        keep_alive: Optional[str] = None,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.default_concurrency = max(1, default_concurrency)
+        self.model_limits = dict(model_limits or {})
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout if queue_timeout is not None else timeout
+        self._limiters: Dict[str, _ModelLimiter] = {}
+        self.keep_alive = keep_alive or None
+        self.batch_window = max(0.0, batch_window)
+        self.batch_max_size = max(1, batch_max_size)
+        self._inflight: Dict[Tuple[str, str, float], asyncio.Future] = {}
+        self._coalesced: Dict[str, int] = {}
+        self._batches: Dict[Tuple[str, float], _PendingBatch] = {}
+
+        pool_size = max([self.default_concurrency, *self.model_limits.values()]) * 2
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llm")
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Content-Type": "application/json"})
+
+    @property
+    def is_ollama_generate(self) -> bool:
+        return self.base_url.rstrip("/").endswith("api/generate")
+
+    @property
+    def server_url(self) -> str:
+        parts = urlsplit(self.base_url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _limiter(self, model: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limit = self.model_limits.get(model, self.default_concurrency)
+            limiter = _ModelLimiter(limit, self.max_queue)
+            self._limiters[model] = limiter
+        return limiter
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            model: {
+                "active": limiter.active,
+                "waiting": limiter.waiting,
+                "max_queue": limiter.max_queue,
+                "coalesced": self._coalesced.get(model, 0),
+            }
+            for model, limiter in self._limiters.items()
+        }
+
+    def build_payload(
+        self, prompt: Union[str, List[str]], model: str, temperature: float, stream: bool = False
+    ) -> dict:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "temperature": temperature,
+        }
+        if stream or self.is_ollama_generate:
+            payload["stream"] = stream
+        if self.keep_alive and self.is_ollama_generate:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    async def _acquire(self, model: str) -> _ModelLimiter:
+        limiter = self._limiter(model)
+        if not limiter.semaphore.locked():
+            # A free slot is taken without suspending, so the queue accounting below stays exact.
+            await limiter.semaphore.acquire()
+        else:
+            if limiter.waiting >= limiter.max_queue:
+                raise LLMBusyError(model)
+            limiter.waiting += 1
+            try:
+                await asyncio.wait_for(limiter.semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise LLMBusyError(model)
+            finally:
+                limiter.waiting -= 1
+        limiter.active += 1
+        return limiter
+
+    @staticmethod
+    def _release(limiter: _ModelLimiter):
+        limiter.active -= 1
+        limiter.semaphore.release()
+
+    def _post(self, payload: dict, stream: bool = False) -> requests.Response:
+        return self._session.post(self.base_url, json=payload, timeout=self.timeout, stream=stream)
+
+    async def _post_json(self, model: str, payload: dict) -> dict:
+        limiter = await self._acquire(model)
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                response = await loop.run_in_executor(self._executor, self._post, payload)
+            except requests.RequestException as exc:
+                logger.error("Unexpected LLM error: %s", exc)
+                raise LLMError(500, "Internal Server Error") from exc
+        finally:
+            self._release(limiter)
+
+        logger.info("LLM status: %s", response.status_code)
+        if response.status_code != 200:
+            logger.error("LLM error: %s", response.text)
+            raise LLMError(response.status_code, "Model response error")
+
+        try:
+            return response.json()
+        except ValueError as exc:
+            logger.error("Invalid LLM payload: %s", response.text)
+            raise LLMError(500, "Invalid response format") from exc
+
+    async def _generate_once(self, prompt: str, model: str, temperature: float) -> str:
+        if self.batch_window > 0 and not self.is_ollama_generate:
+            return await self._submit_to_batch(prompt, model, temperature)
+
+        model_response = await self._post_json(model, self.build_payload(prompt, model, temperature))
+        text = extract_completion_text(model_response)
+        if text is None:
+            logger.error("Invalid LLM payload: %s", model_response)
+            raise LLMError(500, "Invalid response format")
+        return text
+
+    async def _submit_to_batch(self, prompt: str, model: str, temperature: float) -> str:
+        loop = asyncio.get_running_loop()
+        key = (model, temperature)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = _PendingBatch()
+            self._batches[key] = batch
+            batch.timer = loop.call_later(self.batch_window, self._start_flush, key, batch)
+        future = loop.create_future()
+        batch.prompts.append(prompt)
+        batch.futures.append(future)
+        if len(batch.prompts) >= self.batch_max_size:
+            batch.timer.cancel()
+            self._start_flush(key, batch)
+        return await future
+
+    def _start_flush(self, key: Tuple[str, float], batch: "_PendingBatch"):
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        asyncio.ensure_future(self._flush_batch(key[0], key[1], batch))
+
+    async def _flush_batch(self, model: str, temperature: float, batch: "_PendingBatch"):
+        prompts = batch.prompts
+        payload = self.build_payload(prompts[0] if len(prompts) == 1 else prompts, model, temperature)
+        try:
+            model_response = await self._post_json(model, payload)
+            texts = self._split_batch_response(model_response, len(prompts))
+        except Exception as exc:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for future, text in zip(batch.futures, texts):
+            if future.done():
+                continue
+            if text is None:
+                future.set_exception(LLMError(500, "Invalid response format"))
+            else:
+                future.set_result(text)
+
+    @staticmethod
+    def _split_batch_response(model_response: dict, count: int) -> List[Optional[str]]:
+        # OpenAI-style completions answer a prompt list with one choice per prompt, tagged by index.
+        if count == 1:
+            return [extract_completion_text(model_response)]
+        texts: List[Optional[str]] = [None] * count
+        for position, choice in enumerate(model_response.get("choices", [])):
+            index = choice.get("index", position)
+            if 0 <= index < count and texts[index] is None:
+                texts[index] = extract_completion_text({"choices": [choice]})
+        return texts
+
+    async def generate(self, prompt: str, model: str, temperature: float = 0.5) -> str:
+        """Complete ``prompt``; identical concurrent calls share one upstream request."""
+        key = (model, prompt, temperature)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._generate_once(prompt, model, temperature))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget_inflight(key, done))
+        else:
+            self._coalesced[model] = self._coalesced.get(model, 0) + 1
+        # Shielded so one caller giving up does not cancel the request the others are waiting on.
+        return await asyncio.shield(task)
+
+    def _forget_inflight(self, key: Tuple[str, str, float], task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every waiter has already gone away.
+            task.exception()
+
+    async def open_stream(self, prompt: str, model: str, temperature: float = 0.5) -> "TokenStream":
+        """Start a streamed completion and return an async iterator over its tokens.
+
+        The upstream status is checked before returning, so errors such as an unknown model
+        (404) surface here as LLMError and callers can still fall back or answer with a proper
+        status code. The model slot stays taken until the iterator is exhausted or closed.
+        """
+        limiter = await self._acquire(model)
+        loop = asyncio.get_running_loop()
+        payload = self.build_payload(prompt, model, temperature, stream=True)
+        try:
+            try:
+                response = await loop.run_in_executor(self._executor, self._post, payload, True)
+            except requests.RequestException as exc:
+                logger.error("Unexpected LLM error: %s", exc)
+                raise LLMError(500, "Internal Server Error") from exc
+
+            logger.info("LLM status: %s", response.status_code)
+            if response.status_code != 200:
+                body = await loop.run_in_executor(self._executor, lambda: response.text)
+                response.close()
+                logger.error("LLM error: %s", body)
+                raise LLMError(response.status_code, "Model response error")
+        except BaseException:
+            self._release(limiter)
+            raise
+        return TokenStream(response, lambda: self._release(limiter), self._executor)
+
+    async def list_models(self) -> Optional[Set[str]]:
+        """Names of the models the backend serves, or None when it cannot tell (non-Ollama)."""
+        if not self.is_ollama_generate:
+            return None
+
+        def fetch() -> dict:
+            response = self._session.get(f"{self.server_url}/api/tags", timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(self._executor, fetch)
+        except (requests.RequestException, ValueError) as exc:
+            raise LLMError(503, "LLM backend unavailable") from exc
+        return {
+            normalize_model_name(entry.get("name") or entry.get("model") or "")
+            for entry in data.get("models", [])
+        }
+
+    async def preload(self, model: str):
+        """Load ``model`` into memory without generating anything (Ollama only)."""
+        payload = {"model": model}
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        await self._post_json(model, payload)
+
+    def close(self):
+        self._session.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LLMBackendManager:
+    """Keeps the configured models warm and remembers which of them the backend serves.
+
+    ``refresh`` probes the model list, preloads the available models with the client's keep-alive
+    and records readiness plus load latency; ``run`` repeats it every ``refresh_interval`` seconds so
+    the models stay resident. Models the backend does not have are resolved to the fallback without
+    a wasted request.
+    """
+
+    def __init__(
+        self,
+        client: LLMClient,
+        models: List[str],
+        preload: bool = True,
+        refresh_interval: float = 300.0,
+    ):
+        self.client = client
+        self.models = list(dict.fromkeys(model for model in models if model))
+        self.preload = preload
+        self.refresh_interval = refresh_interval
+        self.ready = False
+        self.checked_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._missing: Set[str] = set()
+        self._models: Dict[str, dict] = {
+            model: {"available": None, "loaded": False, "load_seconds": None, "keepalive_seconds": None, "error": None}
+            for model in self.models
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as exc:
+                logger.error("LLM backend refresh failed: %s", exc)
+            await asyncio.sleep(self.refresh_interval)
+
+    async def refresh(self):
+        try:
+            available = await self.client.list_models()
+        except LLMError as exc:
+            logger.error("LLM backend probe failed: %s", exc.__cause__ or exc)
+            self.ready = False
+            self.last_error = exc.detail
+            self.checked_at = time.time()
+            return
+
+        self.last_error = None
+        for model in self.models:
+            entry = self._models[model]
+            if available is not None and normalize_model_name(model) not in available:
+                self.mark_missing(model)
+                continue
+            self._missing.discard(model)
+            entry["available"] = True
+            if self.preload and self.client.is_ollama_generate:
+                await self._preload(model, entry)
+
+        self.ready = any(entry["available"] for entry in self._models.values())
+        self.checked_at = time.time()
+
+    async def _preload(self, model: str, entry: dict):
+        started = time.perf_counter()
+        try:
+            await self.client.preload(model)
+        except LLMError as exc:
+            if exc.status_code == 404:
+                self.mark_missing(model)
+            else:
+                entry["loaded"] = False
+                entry["error"] = exc.detail
+            return
+        elapsed = round(time.perf_counter() - started, 3)
+        # The first successful call pays the load from disk; later ones only refresh keep-alive.
+        entry["keepalive_seconds" if entry["loaded"] else "load_seconds"] = elapsed
+        entry["loaded"] = True
+        entry["error"] = None
+
+    def mark_missing(self, model: str):
+        self._missing.add(model)
+        entry = self._models.get(model)
+        if entry is not None:
+            entry.update(available=False, loaded=False, error="Model not available")
+
+    def resolve(self, model: str, fallback: str) -> str:
+        return fallback if model in self._missing and fallback else model
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "checked_at": self.checked_at,
+            "error": self.last_error,
+            "models": {model: dict(entry) for model, entry in self._models.items()},
+            "queues": self.client.stats(),
+        }
@@ -1,42 +1,159 @@
 import asyncio
+import hashlib
 import logging
 import os
 import re
 import json
+import tempfile
 import threading
-from datetime import datetime
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 from importlib.util import module_from_spec, spec_from_file_location
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Iterable, List, Optional
 
-import requests
-from fastapi import File, FastAPI, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import File, FastAPI, HTTPException, Request, Response, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+from file_index import DirectoryIndex, watch_directories
+from image_variants import ImageVariants
+from jobs import FINAL_STATUSES, Job, JobQueue
+from llm import (
+    LLMBackendManager,
+    LLMBusyError,
+    LLMClient,
+    LLMError,
+    ResponseCache,
+    TokenStream,
+    parse_model_limits,
+)
+from meta_store import FileMetaStore
+from state import create_state_backend
+from static_assets import IMMUTABLE_CACHE_CONTROL, AssetManifest, AssetStaticFiles, PageCache
 
 # Dynamic import to support the renamed PDF-generation.py module
 _PDF_MODULE_PATH = Path(__file__).resolve().parent / "static" / "assets" / "PDF-generation.py"
-_pdf_spec = spec_from_file_location("pdf_generation", _PDF_MODULE_PATH)
-if _pdf_spec is None or _pdf_spec.loader is None:
-    raise RuntimeError(f"Nie można wczytać modułu generatora PDF: {_PDF_MODULE_PATH}")
-_pdf_module = module_from_spec(_pdf_spec)
-_pdf_spec.loader.exec_module(_pdf_module)
-
-GenerationError = _pdf_module.GenerationError
-GenerationCancelled = getattr(_pdf_module, "GenerationCancelled", GenerationError)
-generate_price_list = _pdf_module.generate_price_list
+_pdf_module = None
+_pdf_module_lock = threading.Lock()
+
+
+def _pdf_generator():
+    """Generator PDF wczytywany przy pierwszym użyciu WANO - PyPDF2, reportlab i openpyxl
+    ładują się tylko w procesach, które naprawdę generują cenniki."""
+    global _pdf_module
+    if _pdf_module is None:
+        with _pdf_module_lock:
+            if _pdf_module is None:
+                spec = spec_from_file_location("pdf_generation", _PDF_MODULE_PATH)
+                if spec is None or spec.loader is None:
+                    raise RuntimeError(f"Nie można wczytać modułu generatora PDF: {_PDF_MODULE_PATH}")
+                module = module_from_spec(spec)
+                spec.loader.exec_module(module)
+                _pdf_module = module
+    return _pdf_module
 
 # Configure logging
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Rozgrzewanie generatora i puli LibreOffice: 1 = przy starcie, lazy = przy pierwszym otwarciu strony WANO,
+# 0 = dopiero przy pierwszym generowaniu
+WANO_OFFICE_PREWARM = os.environ.get("WANO_OFFICE_PREWARM", "lazy").lower()
+_office_warmup_started = threading.Event()
+
+
+def _warm_up_generator():
+    try:
+        _pdf_generator().warm_up_office_pool()
+    except Exception as exc:
+        logger.warning("Rozgrzewanie generatora PDF nie powiodło się: %s", exc)
+
+
+def _start_generator_warmup():
+    if _office_warmup_started.is_set():
+        return
+    _office_warmup_started.set()
+    threading.Thread(target=_warm_up_generator, name="office-warmup", daemon=True).start()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WANO_OFFICE_PREWARM == "1":
+        _start_generator_warmup()
+    llm_backend.start()
+    generation_queue.start()
+    # Hashowanie zasobów statycznych dopiero tutaj, nie przy imporcie - strony z cache potrzebują ich adresów
+    await asyncio.to_thread(static_assets.scan)
+    if page_cache is not None:
+        page_cache.warm(_CACHED_PAGES)
+    if STATIC_PRECOMPRESS:
+        threading.Thread(target=static_assets.compress, name="static-compress", daemon=True).start()
+    index_observer = None
+    if WANO_INDEX_WATCH:
+        watched = [WANO_UPLOAD_DIR, WANO_PDFY_DIR, WANO_PDF_OUTPUT_PL_DIR, WANO_PDF_OUTPUT_EN_DIR]
+        index_observer = watch_directories(_directory_index(path) for path in watched)
+    yield
+    if index_observer is not None:
+        index_observer.stop()
+    await llm_backend.stop()
+    llm_client.close()
+    if llm_cache is not None:
+        llm_cache.close()
+    await asyncio.to_thread(generation_queue.shutdown, "Zatrzymanie serwera")
+    if _pdf_module is not None:
+        await asyncio.to_thread(_pdf_module.shutdown_office_pool)
+    meta_store.close()
+    state_backend.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Static & templates
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Zasoby statyczne: adresy z hashem treści (cache "immutable") i wersje gzip/brotli liczone przy starcie
+# serwera (lifespan) albo przy pierwszym odwołaniu do zasobu
+STATIC_PRECOMPRESS = os.environ.get("STATIC_PRECOMPRESS", "1") == "1"
+static_assets = AssetManifest("static")
+app.mount("/static", AssetStaticFiles(directory="static", manifest=static_assets), name="static")
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = static_assets.url
+
+# Pomniejszone wersje obrazków (WebP/JPEG) generowane na żądanie, z limitem rozmiaru cache na dysku
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR") or str(Path(__file__).resolve().parent / "cache" / "images")
+IMAGE_CACHE_MAX_MB = int(os.environ.get("IMAGE_CACHE_MAX_MB", "200"))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "80"))
+image_variants = ImageVariants(
+    "static", IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_MB * 1024 * 1024, quality=IMAGE_QUALITY
+)
+
+
+def image_url(rel: str, width: int) -> str:
+    version = static_assets.version(rel)
+    return f"/img/{width}/{rel}" + (f"?v={version}" if version else "")
+
+
+def image_srcset(rel: str) -> str:
+    """Wartość atrybutu srcset: standardowe szerokości mniejsze od oryginału plus sam oryginał."""
+    return ", ".join(f"{image_url(rel, width)} {width}w" for width in image_variants.widths_for(rel))
+
+
+templates.env.globals["image_url"] = image_url
+templates.env.globals["image_srcset"] = image_srcset
+
+# Strony bez danych zależnych od żądania: renderowane raz (przy starcie) i podawane z pamięci z ETagiem
+PAGE_CACHE_ENABLED = os.environ.get("PAGE_CACHE_ENABLED", "1") == "1"
+_CACHED_PAGES = ("tools.html", "articles.html", "author.html", "werka.html", "wano.html")
+page_cache = PageCache(templates.env) if PAGE_CACHE_ENABLED else None
+
+
+def _render_page(request: Request, name: str) -> Response:
+    if page_cache is None:
+        return templates.TemplateResponse(name, {"request": request})
+    return page_cache.response(name, request.headers)
 
 # LLM configuration (override via env when Mistral-7B is ready)
 LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "http://localhost:11434/api/generate")
@@ -45,6 +162,49 @@ SLEEP_COURSE_MODEL = os.environ.get("SLEEP_COURSE_MODEL") or os.environ.get(
     "MISTRAL_MODEL", "mistral:7b-instruct"
 )
 LLM_TIMEOUT = int(os.environ.get("LLM_TIMEOUT", "90"))
+# Równoległe zapytania na model (domyślnie + nadpisania "model=N,inny=M") i limit kolejki oczekujących
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "2"))
+LLM_MODEL_CONCURRENCY = parse_model_limits(os.environ.get("LLM_MODEL_CONCURRENCY", ""))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "16"))
+# Okno mikro-batchowania w ms (0 = wyłączone; tylko backendy OpenAI przyjmujące listę promptów)
+LLM_BATCH_WINDOW_MS = int(os.environ.get("LLM_BATCH_WINDOW_MS", "0"))
+LLM_BATCH_MAX = int(os.environ.get("LLM_BATCH_MAX", "8"))
+# Utrzymanie modeli w pamięci Ollamy: keep_alive, wczytanie przy starcie i okres ponownego sprawdzania
+LLM_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE", "30m")
+LLM_PRELOAD = os.environ.get("LLM_PRELOAD", "1") == "1"
+LLM_PROBE_INTERVAL = int(os.environ.get("LLM_PROBE_INTERVAL", "300"))
+
+llm_client = LLMClient(
+    LLM_BASE_URL,
+    timeout=LLM_TIMEOUT,
+    default_concurrency=LLM_CONCURRENCY,
+    model_limits=LLM_MODEL_CONCURRENCY,
+    max_queue=LLM_MAX_QUEUE,
+    batch_window=LLM_BATCH_WINDOW_MS / 1000,
+    batch_max_size=LLM_BATCH_MAX,
+    keep_alive=LLM_KEEP_ALIVE,
+)
+llm_backend = LLMBackendManager(
+    llm_client,
+    [SLEEP_COURSE_MODEL, GENERAL_CHAT_MODEL],
+    preload=LLM_PRELOAD,
+    refresh_interval=LLM_PROBE_INTERVAL,
+)
+
+# Trwały cache odpowiedzi LLM (lekcje kursu snu): TTL w sekundach i limit wpisów (LRU)
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH") or str(
+    Path(__file__).resolve().parent / "cache" / "llm_responses.sqlite3"
+)
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "2000"))
+
+llm_cache: Optional[ResponseCache] = None
+if LLM_CACHE_ENABLED:
+    try:
+        llm_cache = ResponseCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+    except Exception as exc:
+        logger.error("LLM response cache disabled (%s): %s", LLM_CACHE_PATH, exc)
 
 # Upload configuration
 WANO_UPLOAD_DIR = os.environ.get("WANO_UPLOAD_DIR", "/home/wano/cenniki")
@@ -53,117 +213,199 @@ WANO_PDF_OUTPUT_EN_DIR = os.environ.get("WANO_PDF_OUTPUT_EN_DIR", "/home/wano/ce
 WANO_PDFY_DIR = os.environ.get("WANO_PDFY_DIR", "/home/wano/pdfy")
 WANO_EX_DIR = os.environ.get("WANO_EX_DIR", "/home/wano/ex")
 WANO_META_FILE = os.path.join(WANO_UPLOAD_DIR, ".wano_meta.json")
-
-# Postęp generacji (proste, per język)
+# Opisy plików, sumy kontrolne i historia generowania; stary .wano_meta.json jest importowany przy pierwszym użyciu
+WANO_META_DB = os.environ.get("WANO_META_DB") or os.path.join(WANO_UPLOAD_DIR, ".wano_meta.sqlite3")
+WANO_META_HISTORY = int(os.environ.get("WANO_META_HISTORY", "20"))
+# Cache-Control pobieranych plików: PDF-y są nadpisywane pod tą samą nazwą, więc zawsze rewalidacja (ETag);
+# wgrane arkusze nigdy nie są nadpisywane, mogą chwilę leżeć w cache przeglądarki
+WANO_PDF_CACHE_CONTROL = os.environ.get("WANO_PDF_CACHE_CONTROL", "private, no-cache")
+WANO_UPLOAD_CACHE_CONTROL = os.environ.get("WANO_UPLOAD_CACHE_CONTROL", "private, max-age=3600")
+# Limit rozmiaru wgrywanych plików (sprawdzany już podczas odbioru) i wielkość porcji zapisu
+WANO_UPLOAD_MAX_BYTES = int(os.environ.get("WANO_UPLOAD_MAX_MB", "100")) * 1024 * 1024
+WANO_UPLOAD_CHUNK_SIZE = int(os.environ.get("WANO_UPLOAD_CHUNK_KB", "1024")) * 1024
+_UPLOAD_PATHS = {"/api/wano/upload", "/api/wano/pdf-library/replace"}
+# Strumień postępu (SSE): odstęp podtrzymania połączenia i maksymalny czas jednego połączenia
+WANO_PROGRESS_HEARTBEAT = int(os.environ.get("WANO_PROGRESS_HEARTBEAT", "15"))
+WANO_PROGRESS_STREAM_TIMEOUT = int(os.environ.get("WANO_PROGRESS_STREAM_TIMEOUT", "900"))
+_PROGRESS_FINAL_STAGES = {"done", "error", "cancelled"}
+# Kolejka zadań generowania: liczba równoległych zadań, historia zakończonych, limit long-pollingu
+WANO_JOB_WORKERS = int(os.environ.get("WANO_JOB_WORKERS", "2"))
+WANO_JOB_HISTORY = int(os.environ.get("WANO_JOB_HISTORY", "50"))
+WANO_JOB_MAX_WAIT = int(os.environ.get("WANO_JOB_MAX_WAIT", "60"))
+# Wspólny stan (postęp, zadania, opisy plików) dla wielu procesów uvicorn:
+# memory = jeden proces, sqlite = procesy na jednym hoście, redis = wiele hostów
+WANO_STATE_BACKEND = os.environ.get("WANO_STATE_BACKEND", "memory")
+WANO_STATE_PATH = os.environ.get("WANO_STATE_PATH") or os.path.join(WANO_UPLOAD_DIR, ".wano_state.sqlite3")
+WANO_STATE_REDIS_URL = os.environ.get("WANO_STATE_REDIS_URL", "redis://localhost:6379/0")
+# Jak często strumień SSE sprawdza postęp zapisany przez inne procesy
+WANO_PROGRESS_POLL = float(os.environ.get("WANO_PROGRESS_POLL", "1"))
+# Indeks plików w katalogach WANO: jak często sprawdzać zmiany z zewnątrz (mtime katalogu),
+# co ile pełne skanowanie i czy nasłuchiwać zdarzeń systemu plików (wymaga pakietu watchdog)
+WANO_INDEX_CHECK_INTERVAL = float(os.environ.get("WANO_INDEX_CHECK_INTERVAL", "1"))
+WANO_INDEX_RESCAN_INTERVAL = float(os.environ.get("WANO_INDEX_RESCAN_INTERVAL", "300"))
+WANO_INDEX_WATCH = os.environ.get("WANO_INDEX_WATCH", "1") == "1"
+
+state_backend = create_state_backend(WANO_STATE_BACKEND, path=WANO_STATE_PATH, url=WANO_STATE_REDIS_URL)
+
+class _UploadSizeLimitMiddleware:
+    """Przerywa odbiór uploadu po przekroczeniu limitu, zanim całe ciało trafi na dysk."""
+
+    def __init__(self, app, paths: set[str], max_bytes: int):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.max_bytes
+        # Narzut multipart (nagłówki części, granice) jest niewielki - 64 KB zapasu wystarcza
+        limit = max_bytes + 64 * 1024
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _upload_too_large(max_bytes)
+            return message
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                response = Response(
+                    json.dumps({"detail": _upload_too_large(max_bytes).detail}, ensure_ascii=False),
+                    status_code=413,
+                    media_type="application/json",
+                )
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, limited_receive, send)
+
+
+def _upload_too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Plik jest za duży (limit {max_bytes // (1024 * 1024)} MB).")
+
+
+app.add_middleware(_UploadSizeLimitMiddleware, paths=_UPLOAD_PATHS, max_bytes=WANO_UPLOAD_MAX_BYTES)
+
+# Postęp generacji (per język) - słuchacze SSE tego procesu dostają zmiany od razu
 _progress_lock = threading.Lock()
-_progress: dict[str, dict] = {}
-_meta_lock = threading.Lock()
-_generation_lock = threading.Lock()
-_generation_jobs: dict[str, dict] = {}
+_progress_subscribers: dict[str, set] = {}
 
 
 def _set_progress(language: str, stage: str, percent: int, message: str = ""):
+    entry = {
+        "stage": stage,
+        "percent": int(max(0, min(100, percent))),
+        "message": message,
+        "updated": datetime.now(timezone.utc).isoformat(),
+    }
+    state_backend.set("progress", language, entry)
     with _progress_lock:
-        _progress[language] = {
-            "stage": stage,
-            "percent": int(max(0, min(100, percent))),
-            "message": message,
-            "updated": datetime.utcnow().isoformat(),
-        }
+        subscribers = list(_progress_subscribers.get(language, ()))
+
+    # Wywoływane także z wątku generatora - kolejki słuchaczy SSE zasilamy przez ich pętlę zdarzeń
+    for loop, queue in subscribers:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, entry)
+        except RuntimeError:
+            pass
 
 
-def _get_progress(language: str) -> dict:
+def _subscribe_progress(language: str) -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue()
     with _progress_lock:
-        return _progress.get(language, {"stage": "idle", "percent": 0, "message": ""})
+        _progress_subscribers.setdefault(language, set()).add((asyncio.get_running_loop(), queue))
+    return queue
 
 
-def _load_meta() -> dict:
-    with _meta_lock:
-        try:
-            with open(WANO_META_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-        except Exception:
-            return {}
+def _unsubscribe_progress(language: str, queue: asyncio.Queue):
+    with _progress_lock:
+        subscribers = _progress_subscribers.get(language, set())
+        subscribers.difference_update({item for item in subscribers if item[1] is queue})
 
 
-def _save_meta(meta: dict):
-    os.makedirs(WANO_UPLOAD_DIR, exist_ok=True)
-    with _meta_lock:
-        with open(WANO_META_FILE, "w", encoding="utf-8") as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
+def _get_progress(language: str) -> dict:
+    return state_backend.get("progress", language) or {"stage": "idle", "percent": 0, "message": ""}
 
 
-def _list_pdf_library() -> List[dict]:
-    if not os.path.exists(WANO_PDFY_DIR):
-        return []
+meta_store = FileMetaStore(WANO_META_DB, legacy_json=WANO_META_FILE)
 
-    entries: List[dict] = []
-    base_dir = os.path.abspath(WANO_PDFY_DIR)
-    for name in os.listdir(base_dir):
-        if not name.lower().endswith(".pdf"):
-            continue
-        path = os.path.abspath(os.path.join(base_dir, name))
-        if not path.startswith(base_dir + os.sep):
-            continue
-        if not os.path.isfile(path):
-            continue
-        stat = os.stat(path)
-        entries.append(
-            {
-                "file": name,
-                "href": f"/api/wano/pdf-library/download/{name}",
-                "size": stat.st_size,
-                "date": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
-            }
-        )
 
-    entries.sort(key=lambda x: x["file"].lower())
-    return entries
+_directory_indexes: dict[str, DirectoryIndex] = {}
+_directory_indexes_lock = threading.Lock()
 
 
-def _start_generation_job(language: str) -> dict:
-    language = language.lower()
-    if language not in {"pl", "en"}:
-        raise HTTPException(status_code=400, detail="Język musi być pl albo en.")
-    with _generation_lock:
-        if language in _generation_jobs:
-            raise HTTPException(status_code=409, detail=f"Generowanie {language.upper()} już trwa.")
-        job = {"cancel": threading.Event()}
-        _generation_jobs[language] = job
-        return job
+def _directory_index(directory: str) -> DirectoryIndex:
+    path = os.path.abspath(directory)
+    with _directory_indexes_lock:
+        index = _directory_indexes.get(path)
+        if index is None:
+            index = DirectoryIndex(
+                path, check_interval=WANO_INDEX_CHECK_INTERVAL, rescan_interval=WANO_INDEX_RESCAN_INTERVAL
+            )
+            _directory_indexes[path] = index
+        return index
 
 
-def _finish_generation_job(language: str):
-    language = language.lower()
-    with _generation_lock:
-        _generation_jobs.pop(language, None)
+def _index_touch(path: str):
+    # Zapisy wykonane przez aplikację trafiają do indeksu od razu, bez czekania na skan
+    index = _directory_indexes.get(os.path.dirname(os.path.abspath(path)))
+    if index is not None:
+        index.touch(os.path.basename(path))
 
 
-def _cancel_generation_job(language: str, reason: str = "Przerwano generowanie.") -> bool:
-    language = language.lower()
-    if language not in {"pl", "en"}:
-        return False
+def _pdf_library_entries(entries) -> List[dict]:
+    return [
+        {
+            "file": entry.name,
+            "href": f"/api/wano/pdf-library/download/{entry.name}",
+            "size": entry.size,
+            "date": datetime.fromtimestamp(entry.mtime).strftime("%Y-%m-%d %H:%M"),
+        }
+        for entry in sorted(
+            (entry for entry in entries if entry.ext == "pdf"), key=lambda entry: entry.name.lower()
+        )
+    ]
 
-    cancelled = False
-    with _generation_lock:
-        job = _generation_jobs.get(language)
-        if job:
-            job["cancel"].set()
-            cancelled = True
 
-    if cancelled:
+def _list_pdf_library() -> List[dict]:
+    return _directory_index(WANO_PDFY_DIR).view("pdf-library", _pdf_library_entries)
+
+
+def _job_languages(language: str) -> set[str]:
+    return {"pl", "en"} if language == "all" else {language}
+
+
+def _cancel_generation_jobs(languages: Iterable[str], reason: str = "Przerwano generowanie.") -> List[Job]:
+    """Przerywa zadania podanych języków, także zadania "all" obejmujące język; zwraca trafione zadania."""
+    languages = [lang.lower() for lang in languages if lang.lower() in {"pl", "en", "all"}]
+    cancelled: dict[str, Job] = {}
+    for language in languages:
+        cancelled.update((job.id, job) for job in generation_queue.cancel_language(language, reason))
+
+    hit_languages = {job.language for job in cancelled.values()}
+    for language in hit_languages:
         _set_progress(language, "cancelled", 100, reason)
-    else:
+    for language in set(languages) - hit_languages:
         _set_progress(language, "idle", 0, "")
-    return cancelled
+    return list(cancelled.values())
 
 
 def _cleanup_after_cancel(language: str):
     language = language.lower()
+    if language == "all":
+        for lang in ("pl", "en"):
+            _cleanup_after_cancel(lang)
+        return
     token = "PL" if language == "pl" else "EN"
-    export_dir = Path(getattr(_pdf_module, "EXPORT_DIR", WANO_EX_DIR))
+    pdf = _pdf_generator()
+    export_dir = Path(getattr(pdf, "EXPORT_DIR", WANO_EX_DIR))
     for pdf_path in export_dir.glob(f"*{token}ex.pdf"):
         try:
             pdf_path.unlink(missing_ok=True)
@@ -177,37 +419,78 @@ def _cleanup_after_cancel(language: str):
             logger.warning("Nie udało się usunąć %s: %s", pdf_path, exc)
 
     output_attr = "OUTPUT_FILE_PL" if language == "pl" else "OUTPUT_FILE_EN"
-    output_path = Path(getattr(_pdf_module, output_attr, ""))
+    output_path = Path(getattr(pdf, output_attr, ""))
     if output_path and output_path.exists():
         try:
             output_path.unlink()
         except Exception as exc:
             logger.warning("Nie udało się usunąć wyniku %s: %s", output_path, exc)
+        _index_touch(str(output_path))
+
+
+def _by_mtime(entry) -> float:
+    return entry.mtime
 
 
 def _find_latest_file(directory: str, exts: set[str]) -> Optional[str]:
-    if not os.path.exists(directory):
-        return None
-    latest_file = None
-    latest_mtime = -1
-    for name in os.listdir(directory):
-        path = os.path.join(directory, name)
-        if not os.path.isfile(path):
-            continue
-        ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
-        if ext not in exts:
-            continue
-        mtime = os.path.getmtime(path)
-        if mtime > latest_mtime:
-            latest_mtime = mtime
-            latest_file = path
-    return latest_file
+    latest = _directory_index(directory).latest(exts)
+    return latest.path if latest else None
 
 
 def _get_pdf_output_dir(language: str) -> str:
     return WANO_PDF_OUTPUT_PL_DIR if language == "pl" else WANO_PDF_OUTPUT_EN_DIR
 
 
+_file_etags: dict[str, tuple[tuple, str]] = {}
+
+
+def _file_etag(path: str, stat: os.stat_result) -> str:
+    # Mocny ETag z treści pliku; skrót liczony raz na wersję pliku (inode, mtime, rozmiar)
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _file_etags.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()[:32]}"'
+    _file_etags[path] = (version, etag)
+    return etag
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match ma pierwszeństwo przed If-Modified-Since (porównanie słabe, RFC 9110)
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def _cached_file_response(request: Request, path: str, filename: str, cache_control: str) -> Response:
+    """FileResponse z walidatorami: 304 dla aktualnej kopii klienta, Range obsługuje FileResponse."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Plik nie istnieje.")
+    etag = await asyncio.to_thread(_file_etag, path, stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+    }
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, filename=filename, headers=headers)
+
+
 class Message(BaseModel):
     text: str
 
@@ -219,6 +502,7 @@ class SleepLessonRequest(BaseModel):
     questions: List[str]
     answers: List[str] = Field(default_factory=list)
     language: str = "en"
+    use_cache: bool = True
 
 
 class FileInfoUpdate(BaseModel):
@@ -231,54 +515,103 @@ class CancelRequest(BaseModel):
     reason: Optional[str] = None
 
 
-def call_llm(prompt: str, model: str, temperature: float = 0.5) -> str:
+def _llm_http_error(exc: LLMError) -> HTTPException:
+    headers = {"Retry-After": "5"} if isinstance(exc, LLMBusyError) else None
+    return HTTPException(status_code=exc.status_code, detail=exc.detail, headers=headers)
+
+
+async def call_llm(prompt: str, model: str, temperature: float = 0.5) -> str:
     """Shared helper for calling the local LLM endpoint."""
     try:
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "temperature": temperature,
-        }
+        return await llm_client.generate(prompt, model, temperature=temperature)
+    except LLMError as exc:
+        raise _llm_http_error(exc)
+    except Exception as exc:
+        logging.error("Unexpected LLM error: %s", exc)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
-        if LLM_BASE_URL.rstrip("/").endswith("api/generate"):
-            payload["stream"] = False
 
-        response = requests.post(
-            LLM_BASE_URL,
-            headers={"Content-Type": "application/json"},
-            json=payload,
-            timeout=LLM_TIMEOUT,
-        )
+async def open_llm_stream(prompt: str, model: str, temperature: float = 0.5) -> TokenStream:
+    """Streaming counterpart of call_llm; errors before the first token become HTTP errors."""
+    try:
+        return await llm_client.open_stream(prompt, model, temperature=temperature)
+    except LLMError as exc:
+        raise _llm_http_error(exc)
+    except Exception as exc:
+        logging.error("Unexpected LLM error: %s", exc)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
-        logging.info("LLM status: %s", response.status_code)
 
-        if response.status_code != 200:
-            logging.error("LLM error: %s", response.text)
-            raise HTTPException(status_code=response.status_code, detail="Model response error")
+async def _cache_get(prompt: str, model: str, temperature: float) -> Optional[str]:
+    if llm_cache is None:
+        return None
+    try:
+        return await asyncio.to_thread(llm_cache.get, model, prompt, temperature)
+    except Exception as exc:
+        logging.error("LLM cache read failed: %s", exc)
+        return None
 
-        model_response = response.json()
-        # Support both OpenAI-style responses (choices) and Ollama's /api/generate payloads.
-        choices = model_response.get("choices", [])
-        if choices:
-            choice = choices[0]
-            text = choice.get("text")
-            if not text:
-                # Some providers send chat choices instead of plain text completions.
-                text = choice.get("message", {}).get("content")
-            if text:
-                return text.strip()
 
-        if "response" in model_response:
-            return model_response["response"].strip()
+async def _cache_put(prompt: str, model: str, temperature: float, text: str):
+    if llm_cache is None or not text:
+        return
+    try:
+        await asyncio.to_thread(llm_cache.put, model, prompt, temperature, text)
+    except Exception as exc:
+        logging.error("LLM cache write failed: %s", exc)
 
-        logging.error("Invalid LLM payload: %s", model_response)
-        raise HTTPException(status_code=500, detail="Invalid response format")
 
-    except HTTPException:
-        raise
+async def call_llm_cached(prompt: str, model: str, temperature: float, use_cache: bool = True) -> tuple[str, str]:
+    """call_llm behind the response cache; returns the text and HIT/MISS/BYPASS."""
+    if llm_cache is None or not use_cache:
+        return await call_llm(prompt, model, temperature=temperature), "BYPASS"
+    cached = await _cache_get(prompt, model, temperature)
+    if cached is not None:
+        return cached, "HIT"
+    text = await call_llm(prompt, model, temperature=temperature)
+    await _cache_put(prompt, model, temperature, text)
+    return text, "MISS"
+
+
+async def _ndjson_tokens(tokens: AsyncIterator[str], on_complete=None):
+    # One JSON object per line: {"token": ...} chunks, then {"done": true} or {"error": ...}.
+    parts = []
+    try:
+        async for token in tokens:
+            parts.append(token)
+            yield json.dumps({"token": token}, ensure_ascii=False) + "\n"
+    except LLMError as exc:
+        yield json.dumps({"error": exc.detail}) + "\n"
+        return
     except Exception as exc:
-        logging.error("Unexpected LLM error: %s", exc)
-        raise HTTPException(status_code=500, detail="Internal Server Error")
+        logging.error("Unexpected LLM stream error: %s", exc)
+        yield json.dumps({"error": "Internal Server Error"}) + "\n"
+        return
+    finally:
+        await tokens.aclose()
+    if on_complete is not None:
+        await on_complete("".join(parts).strip())
+    yield json.dumps({"done": True}) + "\n"
+
+
+async def _single_token(text: str):
+    yield text
+
+
+def _token_stream_response(
+    tokens: AsyncIterator[str], on_complete=None, cache_status: Optional[str] = None
+) -> StreamingResponse:
+    # Keep reverse proxies from buffering the token stream.
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if cache_status:
+        headers["X-LLM-Cache"] = cache_status
+    return StreamingResponse(
+        _ndjson_tokens(tokens, on_complete),
+        media_type="application/x-ndjson",
+        headers=headers,
+        # Frees the model slot even if the client disconnects before the first chunk.
+        background=BackgroundTask(tokens.aclose),
+    )
 
 
 def build_sleep_prompt(payload: SleepLessonRequest) -> str:
@@ -311,27 +644,50 @@ def build_sleep_prompt(payload: SleepLessonRequest) -> str:
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    return templates.TemplateResponse("tools.html", {"request": request})
+    return _render_page(request, "tools.html")
 
 
 @app.get("/articles", response_class=HTMLResponse)
 async def read_articles(request: Request):
-    return templates.TemplateResponse("articles.html", {"request": request})
+    return _render_page(request, "articles.html")
 
 
 @app.get("/author", response_class=HTMLResponse)
 async def read_author(request: Request):
-    return templates.TemplateResponse("author.html", {"request": request})
+    return _render_page(request, "author.html")
 
 
 @app.get("/werka", response_class=HTMLResponse)
 async def read_werka(request: Request):
-    return templates.TemplateResponse("werka.html", {"request": request})
+    return _render_page(request, "werka.html")
 
 
 @app.get("/wano", response_class=HTMLResponse)
 async def read_wano(request: Request):
-    return templates.TemplateResponse("wano.html", {"request": request})
+    if WANO_OFFICE_PREWARM == "lazy":
+        _start_generator_warmup()
+    return _render_page(request, "wano.html")
+
+
+@app.get("/img/{width}/{path:path}")
+async def get_image_variant(width: int, path: str, request: Request, v: Optional[str] = None):
+    # WebP dla przeglądarek, które go akceptują; reszta dostaje JPEG/PNG (stąd Vary: Accept)
+    fmt = image_variants.output_format(path, "image/webp" in request.headers.get("accept", ""))
+    variant = await asyncio.to_thread(image_variants.variant, path, width, fmt)
+    if variant is None:
+        raise HTTPException(status_code=404, detail="Nie znaleziono obrazka.")
+
+    current = static_assets.version(path)
+    headers = {
+        "Vary": "Accept",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if v and v == current else "public, max-age=3600",
+    }
+    media_type = image_variants.media_type(fmt) if image_variants.available else None
+    stat = os.stat(variant)
+    response = FileResponse(variant, media_type=media_type, headers=headers, stat_result=stat)
+    if _not_modified(request, response.headers["etag"], stat.st_mtime):
+        return Response(status_code=304, headers={**headers, "ETag": response.headers["etag"]})
+    return response
 
 
 @app.get("/test")
@@ -341,63 +697,220 @@ def test_endpoint():
 
 @app.post("/chat")
 async def chat_with_model(message: Message):
-    response_text = call_llm(message.text, GENERAL_CHAT_MODEL, temperature=0.5)
+    response_text = await call_llm(message.text, GENERAL_CHAT_MODEL, temperature=0.5)
     return {"response": response_text}
 
 
 @app.post("/sleep/lesson")
-async def generate_sleep_lesson(payload: SleepLessonRequest):
+async def generate_sleep_lesson(payload: SleepLessonRequest, response: Response):
     prompt = build_sleep_prompt(payload)
-    model_name = SLEEP_COURSE_MODEL or GENERAL_CHAT_MODEL
+    model_name = llm_backend.resolve(SLEEP_COURSE_MODEL or GENERAL_CHAT_MODEL, GENERAL_CHAT_MODEL)
     try:
-        lesson = call_llm(prompt, model_name, temperature=0.3)
+        lesson, cache_status = await call_llm_cached(prompt, model_name, 0.3, payload.use_cache)
     except HTTPException as exc:
         if exc.status_code == 404 and model_name != GENERAL_CHAT_MODEL:
-            lesson = call_llm(prompt, GENERAL_CHAT_MODEL, temperature=0.3)
+            llm_backend.mark_missing(model_name)
+            lesson, cache_status = await call_llm_cached(prompt, GENERAL_CHAT_MODEL, 0.3, payload.use_cache)
         else:
             raise
+    response.headers["X-LLM-Cache"] = cache_status
     return {"lesson": lesson}
 
 
-@app.post("/api/wano/generate/{language}")
-async def generate_wano_pdf(language: str):
-    language = language.lower()
-    latest_excel = _find_latest_file(WANO_UPLOAD_DIR, {"xlsm", "xlsx"})
-    if not latest_excel:
-        raise HTTPException(status_code=400, detail="Brak źródłowego pliku cennika w /home/wano/cenniki.")
+@app.post("/chat/stream")
+async def chat_with_model_stream(message: Message):
+    tokens = await open_llm_stream(message.text, GENERAL_CHAT_MODEL, temperature=0.5)
+    return _token_stream_response(tokens)
+
 
-    job = _start_generation_job(language)
-    cancel_event = job["cancel"]
+@app.post("/sleep/lesson/stream")
+async def stream_sleep_lesson(payload: SleepLessonRequest):
+    prompt = build_sleep_prompt(payload)
+    model_name = llm_backend.resolve(SLEEP_COURSE_MODEL or GENERAL_CHAT_MODEL, GENERAL_CHAT_MODEL)
+    use_cache = payload.use_cache and llm_cache is not None
+
+    async def open_model(model: str):
+        if use_cache:
+            cached = await _cache_get(prompt, model, 0.3)
+            if cached is not None:
+                return _token_stream_response(_single_token(cached), cache_status="HIT")
+        tokens = await open_llm_stream(prompt, model, temperature=0.3)
+        on_complete = (lambda text: _cache_put(prompt, model, 0.3, text)) if use_cache else None
+        return _token_stream_response(tokens, on_complete, "MISS" if use_cache else "BYPASS")
 
     try:
-        _set_progress(language, "start", 1, "Start")
+        return await open_model(model_name)
+    except HTTPException as exc:
+        if exc.status_code == 404 and model_name != GENERAL_CHAT_MODEL:
+            llm_backend.mark_missing(model_name)
+            return await open_model(GENERAL_CHAT_MODEL)
+        raise
 
-        def progress_cb(stage: str, pct: int, msg: str):
-            _set_progress(language, stage, pct, msg)
 
-        output = await asyncio.to_thread(
-            generate_price_list,
-            language,
-            latest_excel,
-            progress_cb,
-            cancel_event,
-        )
-        _set_progress(language, "done", 100, "Gotowe")
-        download_href = f"/api/wano/download/pdf/{language}/{os.path.basename(output)}"
-        return {"message": "PDF wygenerowany", "output": output, "language": language, "download": download_href}
-    except GenerationCancelled as exc:
+@app.get("/api/llm/status")
+async def get_llm_status():
+    return llm_backend.status()
+
+
+_GENERATION_FAILED = "Błąd generowania cennika."
+
+
+def _run_generation_job(job: Job) -> dict:
+    """Wykonywane w wątku kolejki zadań - generuje cennik(i) i zwraca opis wyniku."""
+    language = job.language
+    _set_progress(language, "start", 1, "Start")
+
+    def progress_cb(stage: str, pct: int, msg: str):
+        _set_progress(language, stage, pct, msg)
+
+    try:
+        pdf = _pdf_generator()
+    except Exception:
+        logging.error("WANO generator import error", exc_info=True)
+        _set_progress(language, "error", 100, "Błąd generowania.")
+        raise
+
+    try:
+        if language == "all":
+            outputs = pdf.generate_price_lists(("pl", "en"), job.source, progress_cb, job.cancel_event)
+            result = {
+                "message": "PDF wygenerowane",
+                "output": ", ".join(os.path.basename(path) for path in outputs.values()),
+                "outputs": outputs,
+                "language": language,
+                "downloads": {
+                    lang: f"/api/wano/download/pdf/{lang}/{os.path.basename(path)}" for lang, path in outputs.items()
+                },
+            }
+        else:
+            output = pdf.generate_price_list(language, job.source, progress_cb, job.cancel_event)
+            download_href = f"/api/wano/download/pdf/{language}/{os.path.basename(output)}"
+            result = {"message": "PDF wygenerowany", "output": output, "language": language, "download": download_href}
+    except pdf.GenerationCancelled:
         _cleanup_after_cancel(language)
-        message = str(exc) or "Generowanie przerwane."
-        raise HTTPException(status_code=400, detail=message)
-    except GenerationError as exc:
+        raise
+    except pdf.GenerationError as exc:
         _set_progress(language, "error", 100, str(exc))
-        raise HTTPException(status_code=400, detail=str(exc))
+        raise
     except Exception as exc:  # pragma: no cover - defensive
         logging.error("WANO generation error: %s", exc, exc_info=True)
         _set_progress(language, "error", 100, "Błąd generowania.")
-        raise HTTPException(status_code=500, detail="Błąd generowania cennika.")
-    finally:
-        _finish_generation_job(language)
+        raise pdf.GenerationError(_GENERATION_FAILED) from exc
+
+    outputs = result["outputs"].values() if language == "all" else [result["output"]]
+    for path in outputs:
+        _index_touch(path)
+    try:
+        meta_store.append(
+            os.path.basename(job.source),
+            "generations",
+            {"job": job.id, "language": language, "finished": time.time(), "outputs": [os.path.basename(p) for p in outputs]},
+            limit=WANO_META_HISTORY,
+        )
+    except Exception as exc:
+        logger.warning("Nie udało się zapisać historii generowania: %s", exc)
+    _set_progress(language, "done", 100, "Gotowe")
+    return result
+
+
+generation_queue = JobQueue(
+    _run_generation_job,
+    backend=state_backend,
+    workers=WANO_JOB_WORKERS,
+    history=WANO_JOB_HISTORY,
+    stale_message="Proces generujący przestał odpowiadać.",
+)
+
+
+def _submit_generation_job(language: str) -> tuple[Job, bool]:
+    language = language.lower()
+    if language not in {"pl", "en", "all"}:
+        raise HTTPException(status_code=400, detail="Język musi być pl, en albo all.")
+    latest_excel = _find_latest_file(WANO_UPLOAD_DIR, {"xlsm", "xlsx"})
+    if not latest_excel:
+        raise HTTPException(status_code=400, detail="Brak źródłowego pliku cennika w /home/wano/cenniki.")
+
+    # Ten sam plik źródłowy i język w kolejce lub w trakcie = to samo zadanie
+    stat = os.stat(latest_excel)
+    key = [language, os.path.abspath(latest_excel), stat.st_mtime_ns, stat.st_size]
+    def reset_progress(job: Job):
+        # Nowe zadanie zastępuje końcowy stan poprzedniego - słuchacze SSE nie dostaną starego "done"
+        _set_progress(job.language, "queued", 0, "W kolejce")
+
+    try:
+        return generation_queue.submit(language, latest_excel, key, _job_languages(language), on_created=reset_progress)
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="Serwer jest zatrzymywany.")
+
+
+def _job_payload(job: Job) -> dict:
+    payload = job.to_dict()
+    payload["position"] = generation_queue.position(job)
+    return payload
+
+
+def _get_job_or_404(job_id: str) -> Job:
+    job = generation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Nie znaleziono zadania.")
+    return job
+
+
+@app.post("/api/wano/jobs/{language}", status_code=202)
+async def submit_wano_job(language: str):
+    job, created = _submit_generation_job(language)
+    payload = _job_payload(job)
+    payload["deduplicated"] = not created
+    return payload
+
+
+@app.get("/api/wano/jobs")
+async def list_wano_jobs(active: bool = False):
+    return {"jobs": [_job_payload(job) for job in generation_queue.jobs(active_only=active)]}
+
+
+@app.get("/api/wano/jobs/{job_id}")
+async def get_wano_job(job_id: str, wait: float = 0):
+    job = _get_job_or_404(job_id)
+    if wait > 0 and not job.is_finished:
+        # Long-polling: odpowiedź po zakończeniu zadania, najpóźniej po `wait` s
+        job = await generation_queue.wait(job_id, min(wait, WANO_JOB_MAX_WAIT)) or job
+    return _job_payload(job)
+
+
+@app.get("/api/wano/jobs/{job_id}/result")
+async def get_wano_job_result(job_id: str):
+    job = _get_job_or_404(job_id)
+    if job.status == "done":
+        return job.result
+    if job.status not in FINAL_STATUSES:
+        raise HTTPException(status_code=409, detail="Zadanie jeszcze trwa.")
+    raise HTTPException(status_code=400, detail=job.error or "Generowanie przerwane.")
+
+
+@app.post("/api/wano/jobs/{job_id}/cancel")
+async def cancel_wano_job(job_id: str, payload: Optional[CancelRequest] = None):
+    job = _get_job_or_404(job_id)
+    reason = (payload.reason if payload else None) or "Generowanie przerwane."
+    was_active = not job.is_finished
+    job = generation_queue.cancel(job_id, reason) or job
+    if was_active:
+        _set_progress(job.language, "cancelled", 100, reason)
+    return _job_payload(job)
+
+
+@app.post("/api/wano/generate/{language}")
+async def generate_wano_pdf(language: str):
+    # Zgodność wstecz: zleca zadanie i czeka na wynik; zerwanie połączenia nie przerywa zadania
+    job, _ = _submit_generation_job(language)
+    job = await generation_queue.wait(job.id) or job
+    if job.status == "done":
+        return job.result
+    if job.status == "cancelled":
+        raise HTTPException(status_code=400, detail=job.error or "Generowanie przerwane.")
+    if job.error == _GENERATION_FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    raise HTTPException(status_code=400, detail=job.error or _GENERATION_FAILED)
 
 
 @app.post("/api/wano/cancel")
@@ -405,14 +918,80 @@ async def cancel_wano_generation(payload: CancelRequest):
     language = (payload.language or "").lower()
     reason = payload.reason or "Generowanie przerwane."
 
-    if language in {"pl", "en"}:
-        cancelled = _cancel_generation_job(language, reason)
-        return {"language": language, "cancelled": cancelled}
+    if language not in {"pl", "en"}:
+        language = "all"
+    jobs = _cancel_generation_jobs(("pl", "en", "all") if language == "all" else (language,), reason)
+    return {
+        "language": language,
+        "cancelled": bool(jobs),
+        "jobs": [{"id": job.id, "language": job.language} for job in jobs],
+    }
 
-    cancelled_any = False
-    for lang in ("pl", "en"):
-        cancelled_any = _cancel_generation_job(lang, reason) or cancelled_any
-    return {"language": "all", "cancelled": cancelled_any}
+
+def _remove_quietly(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except Exception as exc:
+        logger.warning("Nie udało się usunąć %s: %s", path, exc)
+
+
+def _write_chunk(out_file, digest, chunk: bytes):
+    digest.update(chunk)
+    out_file.write(chunk)
+
+
+async def _stream_upload_to_temp(file: UploadFile, directory: str) -> tuple[str, int, str]:
+    """Zapisuje upload porcjami do pliku tymczasowego w katalogu docelowym.
+
+    Zwraca (ścieżka, rozmiar, sha256). Plik tymczasowy leży na tym samym systemie plików co cel,
+    więc wywołujący może go podmienić atomowo (os.replace / os.link).
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=directory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out_file:
+            while True:
+                chunk = await file.read(WANO_UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > WANO_UPLOAD_MAX_BYTES:
+                    raise _upload_too_large(WANO_UPLOAD_MAX_BYTES)
+                await asyncio.to_thread(_write_chunk, out_file, digest, chunk)
+            await asyncio.to_thread(out_file.flush)
+            await asyncio.to_thread(os.fsync, out_file.fileno())
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    os.chmod(tmp_path, 0o644)
+    return tmp_path, size, digest.hexdigest()
+
+
+def _publish_upload(tmp_path: str, dest_path: str) -> bool:
+    """Publikuje plik tymczasowy pod nazwą docelową; False, gdy nazwa jest już zajęta."""
+    try:
+        os.link(tmp_path, dest_path)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        # System plików bez twardych linków (np. SMB/FAT): rezerwacja nazwy, potem podmiana
+        pass
+    try:
+        fd = os.open(dest_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    try:
+        os.replace(tmp_path, dest_path)
+    except OSError:
+        _remove_quietly(dest_path)
+        raise
+    return True
 
 
 @app.post("/api/wano/upload")
@@ -429,10 +1008,8 @@ async def upload_wano_file(file: UploadFile = File(...)):
     base, original_ext = os.path.splitext(safe_name)
 
     # Znajdź najwyższy sufiks numeryczny dla danego prefixu i przedłuż.
-    try:
-        existing = os.listdir(WANO_UPLOAD_DIR)
-    except FileNotFoundError:
-        existing = []
+    upload_index = _directory_index(WANO_UPLOAD_DIR)
+    existing = upload_index.names()
 
     pattern = re.compile(rf"^{re.escape(base)}(\d+)?{re.escape(original_ext)}$", re.IGNORECASE)
     max_suffix = 0
@@ -446,13 +1023,12 @@ async def upload_wano_file(file: UploadFile = File(...)):
                 max_suffix = max(max_suffix, 0)
 
     next_suffix = max_suffix + 1
-    numbered_name = f"{base}{next_suffix}{original_ext}"
-    dest_path = os.path.abspath(os.path.join(WANO_UPLOAD_DIR, numbered_name))
+    dest_path = os.path.abspath(os.path.join(WANO_UPLOAD_DIR, f"{base}{next_suffix}{original_ext}"))
 
     try:
-        contents = await file.read()
-        with open(dest_path, "wb") as out_file:
-            out_file.write(contents)
+        tmp_path, size, sha256 = await _stream_upload_to_temp(file, WANO_UPLOAD_DIR)
+    except HTTPException:
+        raise
     except Exception as exc:
         logging.error("WANO upload error (write): %s", exc, exc_info=True)
         raise HTTPException(
@@ -460,16 +1036,40 @@ async def upload_wano_file(file: UploadFile = File(...)):
             detail=f"Nie udało się zapisać pliku ({exc}). Ścieżka: {dest_path}",
         )
 
+    # Publikacja nie nadpisuje istniejącego pliku - równoległy upload o tej samej nazwie dostaje kolejny numer
+    try:
+        while True:
+            numbered_name = f"{base}{next_suffix}{original_ext}"
+            dest_path = os.path.abspath(os.path.join(WANO_UPLOAD_DIR, numbered_name))
+            if _publish_upload(tmp_path, dest_path):
+                break
+            next_suffix += 1
+    except OSError as exc:
+        logging.error("WANO upload error (publish): %s", exc, exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Nie udało się zapisać pliku ({exc}). Ścieżka: {dest_path}",
+        )
+    finally:
+        _remove_quietly(tmp_path)
+    upload_index.touch(numbered_name)
+    try:
+        meta_store.update(numbered_name, {"sha256": sha256, "size": size, "uploaded": time.time()})
+    except Exception as exc:
+        logger.warning("Nie udało się zapisać metadanych %s: %s", numbered_name, exc)
+
     return {
         "message": "Plik zapisany",
         "filename": numbered_name,
         "path": f"/api/wano/download/{numbered_name}",
         "info": "Wgrany przez UI",
+        "size": size,
+        "sha256": sha256,
     }
 
 
 @app.get("/api/wano/download/{filename}")
-async def download_wano_file(filename: str):
+async def download_wano_file(filename: str, request: Request):
     safe_name = os.path.basename(filename)
     file_path = os.path.abspath(os.path.join(WANO_UPLOAD_DIR, safe_name))
 
@@ -480,39 +1080,25 @@ async def download_wano_file(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Plik nie istnieje.")
 
-    return FileResponse(file_path, filename=safe_name)
+    return await _cached_file_response(request, file_path, safe_name, WANO_UPLOAD_CACHE_CONTROL)
 
 
 @app.get("/api/wano/files")
 async def list_wano_files():
-    if not os.path.exists(WANO_UPLOAD_DIR):
+    entries = _directory_index(WANO_UPLOAD_DIR).sorted({"xlsm", "xlsx"}, key=_by_mtime, reverse=True)
+    if not entries:
         return {"files": []}
 
-    files = []
-    meta = _load_meta()
-    for name in os.listdir(WANO_UPLOAD_DIR):
-        safe_name = os.path.basename(name)
-        ext = safe_name.rsplit(".", 1)[-1].lower() if "." in safe_name else ""
-        if ext not in {"xlsm", "xlsx"}:
-            continue
-        path = os.path.abspath(os.path.join(WANO_UPLOAD_DIR, safe_name))
-        if not os.path.isfile(path):
-            continue
-        mtime = datetime.fromtimestamp(os.path.getmtime(path))
-        if safe_name in meta:
-            info_value = meta.get(safe_name, "")
-        else:
-            info_value = "Wersja z dysku"
-        files.append(
-            {
-                "file": safe_name,
-                "info": info_value,
-                "date": mtime.strftime("%Y-%m-%d %H:%M"),
-                "href": f"/api/wano/download/{safe_name}",
-            }
-        )
-
-    files.sort(key=lambda x: x["date"], reverse=True)
+    info = meta_store.field("info")
+    files = [
+        {
+            "file": entry.name,
+            "info": info.get(entry.name, "Wersja z dysku"),
+            "date": datetime.fromtimestamp(entry.mtime).strftime("%Y-%m-%d %H:%M"),
+            "href": f"/api/wano/download/{entry.name}",
+        }
+        for entry in entries
+    ]
     return {"files": files}
 
 
@@ -522,7 +1108,7 @@ async def list_pdf_library():
 
 
 @app.get("/api/wano/pdf-library/download/{filename}")
-async def download_pdf_library_file(filename: str):
+async def download_pdf_library_file(filename: str, request: Request):
     safe_name = os.path.basename(filename)
     if not safe_name.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Dozwolone są tylko pliki PDF.")
@@ -534,7 +1120,7 @@ async def download_pdf_library_file(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Plik nie istnieje.")
 
-    return FileResponse(file_path, filename=safe_name)
+    return await _cached_file_response(request, file_path, safe_name, WANO_PDF_CACHE_CONTROL)
 
 
 @app.post("/api/wano/pdf-library/replace")
@@ -552,38 +1138,35 @@ async def replace_pdf_library_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Plik o tej nazwie nie istnieje na serwerze.")
 
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as out_file:
-            out_file.write(contents)
+        tmp_path, size, sha256 = await _stream_upload_to_temp(file, base_dir)
+    except HTTPException:
+        raise
+    except Exception as exc:  # pragma: no cover - zapis pliku
+        logging.error("Błąd podmiany PDF: %s", exc, exc_info=True)
+        raise HTTPException(status_code=500, detail="Nie udało się zapisać pliku.")
+
+    try:
+        os.replace(tmp_path, file_path)
     except Exception as exc:  # pragma: no cover - zapis pliku
+        _remove_quietly(tmp_path)
         logging.error("Błąd podmiany PDF: %s", exc, exc_info=True)
         raise HTTPException(status_code=500, detail="Nie udało się zapisać pliku.")
 
-    return {"message": "Plik podmieniony", "file": safe_name}
+    _directory_index(base_dir).touch(safe_name)
+    if _pdf_module is not None:
+        _pdf_module.invalidate_layout_cache(file_path)
+    return {"message": "Plik podmieniony", "file": safe_name, "size": size, "sha256": sha256}
 
 
 def _latest_pdf(lang: str) -> Optional[dict]:
-    directory = _get_pdf_output_dir(lang)
-    if not os.path.exists(directory):
+    latest = _directory_index(_get_pdf_output_dir(lang)).latest({"pdf"})
+    if latest is None:
         return None
-    latest = None
-    latest_mtime = -1
-
-    for name in os.listdir(directory):
-        if not name.lower().endswith(".pdf"):
-            continue
-        path = os.path.abspath(os.path.join(directory, name))
-        if not os.path.isfile(path):
-            continue
-        mtime = os.path.getmtime(path)
-        if mtime > latest_mtime:
-            latest_mtime = mtime
-            latest = {
-                "file": name,
-                "href": f"/api/wano/download/pdf/{lang}/{name}",
-                "date": datetime.fromtimestamp(mtime).strftime("%d.%m.%Y"),
-            }
-    return latest
+    return {
+        "file": latest.name,
+        "href": f"/api/wano/download/pdf/{lang}/{latest.name}",
+        "date": datetime.fromtimestamp(latest.mtime).strftime("%d.%m.%Y"),
+    }
 
 
 @app.get("/api/wano/latest-pdfs")
@@ -592,7 +1175,7 @@ async def get_latest_pdfs():
 
 
 @app.get("/api/wano/download/pdf/{language}/{filename}")
-async def download_pdf(language: str, filename: str):
+async def download_pdf(language: str, filename: str, request: Request):
     language = language.lower()
     if language not in {"pl", "en"}:
         raise HTTPException(status_code=400, detail="Język musi być pl albo en.")
@@ -605,29 +1188,80 @@ async def download_pdf(language: str, filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Plik nie istnieje.")
 
-    return FileResponse(file_path, filename=safe_name)
+    return await _cached_file_response(request, file_path, safe_name, WANO_PDF_CACHE_CONTROL)
 
 
 @app.get("/api/wano/download-latest/{language}")
-async def download_latest_pdf(language: str):
+async def download_latest_pdf(language: str, request: Request):
     language = language.lower()
     if language not in {"pl", "en"}:
         raise HTTPException(status_code=400, detail="Język musi być pl albo en.")
     latest = _latest_pdf(language)
     if not latest:
         raise HTTPException(status_code=404, detail="Brak wygenerowanego pliku.")
-    return await download_pdf(language, latest["file"])
+    return await download_pdf(language, latest["file"], request)
 
 
 @app.get("/api/wano/progress/{language}")
 async def get_wano_progress(language: str):
     language = language.lower()
-    if language not in {"pl", "en"}:
-        raise HTTPException(status_code=400, detail="Język musi być pl albo en.")
+    if language not in {"pl", "en", "all"}:
+        raise HTTPException(status_code=400, detail="Język musi być pl, en albo all.")
     data = _get_progress(language)
     return data
 
 
+def _progress_event(data: dict) -> str:
+    stage = data.get("stage", "")
+    event = stage if stage in _PROGRESS_FINAL_STAGES else "progress"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/api/wano/progress/{language}/stream")
+async def stream_wano_progress(language: str):
+    language = language.lower()
+    if language not in {"pl", "en", "all"}:
+        raise HTTPException(status_code=400, detail="Język musi być pl, en albo all.")
+
+    async def events():
+        queue = _subscribe_progress(language)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WANO_PROGRESS_STREAM_TIMEOUT
+        # Zmiany z innych procesów widać tylko we wspólnym stanie - wtedy sprawdzamy go cyklicznie
+        wait_timeout = min(WANO_PROGRESS_POLL, WANO_PROGRESS_HEARTBEAT) if state_backend.shared else WANO_PROGRESS_HEARTBEAT
+        try:
+            yield "retry: 3000\n\n"
+            data = _get_progress(language)
+            last_updated = data.get("updated")
+            last_sent = loop.time()
+            yield _progress_event(data)
+            while loop.time() < deadline:
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=wait_timeout)
+                except asyncio.TimeoutError:
+                    data = _get_progress(language) if state_backend.shared else None
+                    if data is None or data.get("updated") == last_updated:
+                        if loop.time() - last_sent >= WANO_PROGRESS_HEARTBEAT:
+                            last_sent = loop.time()
+                            yield ": keep-alive\n\n"
+                        continue
+                if data.get("updated") == last_updated:
+                    continue
+                last_updated = data.get("updated")
+                last_sent = loop.time()
+                yield _progress_event(data)
+                if data["stage"] in _PROGRESS_FINAL_STAGES:
+                    break
+        finally:
+            _unsubscribe_progress(language, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/wano/info")
 async def set_wano_file_info(payload: FileInfoUpdate):
     safe_name = os.path.basename(payload.filename)
@@ -637,7 +1271,5 @@ async def set_wano_file_info(payload: FileInfoUpdate):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Plik nie istnieje.")
 
-    meta = _load_meta()
-    meta[safe_name] = payload.info or ""
-    _save_meta(meta)
+    meta_store.set(safe_name, "info", payload.info or "")
     return {"message": "Info zapisane", "file": safe_name, "info": payload.info or ""}
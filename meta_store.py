@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class FileMetaStore:
+    """Per-file metadata (descriptions, content hashes, generation history) stored in SQLite.
+
+    Each value is one ``(file, field)`` row written in its own transaction, so concurrent
+    writers in different processes never overwrite each other's keys. Whole-field reads are
+    served from memory until the database changes; SQLite's ``data_version`` reveals commits
+    made by other processes. Entries of the legacy JSON file (``{file: info}``) are imported
+    into ``legacy_field`` on first open, after which the JSON file is renamed to ``*.migrated``.
+    The database is opened lazily, on first use.
+    """
+
+    def __init__(self, path: str, legacy_json: Optional[str] = None, legacy_field: str = "info"):
+        self.path = path
+        self.legacy_json = legacy_json
+        self.legacy_field = legacy_field
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._cache: Dict[str, Dict[str, Any]] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_meta ("
+                "file TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (file, field))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS file_meta_field ON file_meta (field)")
+            self._conn = conn
+            if self.legacy_json:
+                self._migrate_legacy(conn)
+        # Another process committed since our last read: drop everything cached.
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+        return self._conn
+
+    def _migrate_legacy(self, conn: sqlite3.Connection):
+        # BEGIN IMMEDIATE serialises the import between processes starting at the same time.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            try:
+                with open(self.legacy_json, "r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+            except FileNotFoundError:
+                legacy = None
+            except ValueError:
+                legacy = {}
+            if legacy is None:
+                conn.execute("ROLLBACK")
+                return
+            now = time.time()
+            conn.executemany(
+                "INSERT OR IGNORE INTO file_meta (file, field, value, updated) VALUES (?, ?, ?, ?)",
+                [
+                    (str(name), self.legacy_field, json.dumps(value, ensure_ascii=False), now)
+                    for name, value in (legacy.items() if isinstance(legacy, dict) else [])
+                ],
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        try:
+            os.replace(self.legacy_json, f"{self.legacy_json}.migrated")
+        except FileNotFoundError:
+            pass
+
+    def _write(self, conn: sqlite3.Connection, name: str, values: Dict[str, Any], now: float):
+        conn.executemany(
+            "INSERT OR REPLACE INTO file_meta (file, field, value, updated) VALUES (?, ?, ?, ?)",
+            [(name, field, json.dumps(value, ensure_ascii=False), now) for field, value in values.items()],
+        )
+
+    def _cache_values(self, name: str, values: Dict[str, Any]):
+        for field, value in values.items():
+            cached = self._cache.get(field)
+            if cached is not None:
+                cached[name] = value
+
+    def get(self, name: str, field: str, default: Any = None) -> Any:
+        return self.field(field).get(name, default)
+
+    def field(self, field: str) -> Dict[str, Any]:
+        """Return ``{file: value}`` for one field (a copy of the cached mapping)."""
+        with self._lock:
+            conn = self._connection()
+            cached = self._cache.get(field)
+            if cached is None:
+                rows = conn.execute("SELECT file, value FROM file_meta WHERE field = ?", (field,))
+                cached = self._cache[field] = {name: json.loads(value) for name, value in rows}
+            return dict(cached)
+
+    def file(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._connection().execute("SELECT field, value FROM file_meta WHERE file = ?", (name,))
+            return {field: json.loads(value) for field, value in rows}
+
+    def set(self, name: str, field: str, value: Any):
+        self.update(name, {field: value})
+
+    def update(self, name: str, values: Dict[str, Any]):
+        """Write several fields of one file in a single transaction."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write(conn, name, values, time.time())
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self._cache_values(name, values)
+
+    def append(self, name: str, field: str, item: Any, limit: int = 20):
+        """Append ``item`` to a list field, keeping only the newest ``limit`` items."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM file_meta WHERE file = ? AND field = ?", (name, field)
+                ).fetchone()
+                items = json.loads(row[0]) if row else []
+                if not isinstance(items, list):
+                    items = []
+                items = (items + [item])[-max(1, limit):]
+                self._write(conn, name, {field: items}, time.time())
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self._cache_values(name, {field: items})
+
+    def delete(self, name: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM file_meta WHERE file = ?", (name,))
+            for cached in self._cache.values():
+                cached.pop(name, None)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._data_version = None
+                self._cache.clear()
@@ -0,0 +1,220 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+class StateBackend(ABC):
+    """Key/value store for state that all worker processes must agree on.
+
+    Values are JSON-serialisable dicts grouped by namespace. ``lock(name)`` is a mutex held
+    across processes (for the shared backends) and is used for read-modify-write sequences.
+    ``shared`` tells callers whether other processes can change the data behind their back.
+    """
+
+    shared = True
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: dict):
+        ...
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        ...
+
+    @abstractmethod
+    def items(self, namespace: str) -> Dict[str, dict]:
+        ...
+
+    @abstractmethod
+    def lock(self, name: str):
+        ...
+
+    def close(self):
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """Single-process backend; the default when only one uvicorn worker runs."""
+
+    shared = False
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, str]] = {}
+        self._data_lock = threading.Lock()
+        self._locks: Dict[str, threading.RLock] = {}
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        with self._data_lock:
+            raw = self._data.get(namespace, {}).get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace: str, key: str, value: dict):
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._data_lock:
+            self._data.setdefault(namespace, {})[key] = raw
+
+    def delete(self, namespace: str, key: str):
+        with self._data_lock:
+            self._data.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace: str) -> Dict[str, dict]:
+        with self._data_lock:
+            data = dict(self._data.get(namespace, {}))
+        return {key: json.loads(raw) for key, raw in data.items()}
+
+    @contextmanager
+    def lock(self, name: str) -> Iterator[None]:
+        with self._data_lock:
+            mutex = self._locks.setdefault(name, threading.RLock())
+        with mutex:
+            yield
+
+
+class SQLiteStateBackend(StateBackend):
+    """Local-disk backend shared by all worker processes on one host.
+
+    Data lives in one SQLite database (WAL mode); locks are ``flock`` on files next to it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._fallback_locks: Dict[str, threading.RLock] = {}
+        self._fallback_guard = threading.Lock()
+        self._held = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: dict):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), time.time()),
+        )
+
+    def delete(self, namespace: str, key: str):
+        self._conn().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace: str) -> Dict[str, dict]:
+        rows = self._conn().execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,))
+        return {key: json.loads(value) for key, value in rows}
+
+    @contextmanager
+    def lock(self, name: str) -> Iterator[None]:
+        held = getattr(self._held, "names", None)
+        if held is None:
+            held = self._held.names = set()
+        if name in held or fcntl is None:
+            # Re-entry from the same thread, or no flock on this platform: process-local lock only.
+            with self._fallback_guard:
+                mutex = self._fallback_locks.setdefault(name, threading.RLock())
+            with mutex:
+                yield
+            return
+
+        lock_path = f"{self.path}.{name}.lock"
+        fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            held.add(name)
+            try:
+                yield
+            finally:
+                held.discard(name)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisStateBackend(StateBackend):
+    """Backend for workers spread over several hosts; needs the optional ``redis`` package."""
+
+    def __init__(self, url: str, prefix: str = "wano", lock_timeout: float = 60.0):
+        if redis is None:
+            raise RuntimeError("The redis state backend requires the 'redis' package")
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+
+    def _key(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}"
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        raw = self._client.hget(self._key(namespace), key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace: str, key: str, value: dict):
+        self._client.hset(self._key(namespace), key, json.dumps(value, ensure_ascii=False))
+
+    def delete(self, namespace: str, key: str):
+        self._client.hdel(self._key(namespace), key)
+
+    def items(self, namespace: str) -> Dict[str, dict]:
+        raw = self._client.hgetall(self._key(namespace))
+        return {key.decode("utf-8"): json.loads(value) for key, value in raw.items()}
+
+    def lock(self, name: str):
+        return self._client.lock(f"{self.prefix}:lock:{name}", timeout=self.lock_timeout)
+
+    def close(self):
+        self._client.close()
+
+
+def create_state_backend(kind: str, path: Optional[str] = None, url: Optional[str] = None) -> StateBackend:
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        if not path:
+            raise ValueError("The sqlite state backend needs a database path")
+        return SQLiteStateBackend(path)
+    if kind == "redis":
+        if not url:
+            raise ValueError("The redis state backend needs a URL")
+        return RedisStateBackend(url)
+    raise ValueError(f"Unknown state backend: {kind}")
@@ -1,14 +1,31 @@
+import atexit
+import hashlib
 import logging
 import os
+import queue
 import re
 import shutil
+import socket
 import subprocess
 import tempfile
 import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from io import BytesIO
 from typing import Callable, Iterable, List, Optional
 
-from PyPDF2 import PdfMerger, PdfReader, PdfWriter
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    StreamObject,
+)
 
 try:
     from reportlab.pdfgen import canvas
@@ -21,8 +38,10 @@ except ImportError:  # pragma: no cover - środowisko bez reportlab
 
 try:
     from openpyxl import load_workbook
+    from openpyxl.xml.functions import tostring
 except ImportError:
     load_workbook = None
+    tostring = None
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +70,38 @@ FOOTER_PREFERRED_FONT_PATHS = [
     "/usr/share/fonts/truetype/msttcorefonts/ArialUnicode.ttf",
 ]
 _FOOTER_FONT_IN_USE: Optional[str] = None
+_FOOTER_FONT_LOCK = threading.Lock()
+# Pula ciepłych instancji LibreOffice (każda z własnym profilem i portem)
+OFFICE_POOL_SIZE = max(1, int(os.environ.get("WANO_OFFICE_POOL_SIZE", str(min(4, os.cpu_count() or 1)))))
+# 0 — każda instancja dostaje wolny port od systemu (bezpieczne przy kilku procesach uvicorn);
+# wartość > 0 — stałe porty base+idx, tylko dla pojedynczego procesu.
+OFFICE_BASE_PORT = int(os.environ.get("WANO_OFFICE_BASE_PORT", "0"))
+OFFICE_START_TIMEOUT = float(os.environ.get("WANO_OFFICE_START_TIMEOUT", "30"))
+OFFICE_HEALTH_INTERVAL = float(os.environ.get("WANO_OFFICE_HEALTH_INTERVAL", "30"))
+# "single" — skoroszyt wczytywany raz, arkusze eksportowane kolejno; "per-sheet" — osobne wczytanie na arkusz
+EXPORT_MODE = os.environ.get("WANO_EXPORT_MODE", "single").strip().lower()
+# Liczba arkuszy eksportowanych równolegle (każdy worker korzysta z osobnej instancji z puli)
+EXPORT_WORKERS = max(1, int(os.environ.get("WANO_EXPORT_WORKERS", str(OFFICE_POOL_SIZE))))
+# Cache wyeksportowanych arkuszy (klucz = hash modelu arkusza z openpyxl + pliku układu)
+EXPORT_CACHE_ENABLED = os.environ.get("WANO_EXPORT_CACHE", "1") == "1"
+EXPORT_CACHE_DIR = os.environ.get("WANO_EXPORT_CACHE_DIR") or os.path.join(BASE_DIR, "cache", "ex")
+EXPORT_CACHE_MAX_BYTES = int(float(os.environ.get("WANO_EXPORT_CACHE_MAX_MB", "500")) * 1024 * 1024)
+_EXPORT_CACHE_VERSION = "2"
+_EXPORT_CACHE_LOCK = threading.Lock()
+# Jeden wpis na ścieżkę (rozmiar, mtime, hash) — nowa wersja pliku zastępuje poprzednią
+_FILE_DIGESTS: dict[str, tuple[int, int, str]] = {}
+# Funkcje przeliczane przy każdym otwarciu — arkusz z nimi nie może trafiać do cache
+_VOLATILE_FUNC_RE = re.compile(r"\b(?:TODAY|NOW|RAND|RANDBETWEEN|RANDARRAY|OFFSET|INDIRECT|INFO|CELL)\s*\(", re.IGNORECASE)
+_OBJECT_ADDRESS_RE = re.compile(r" at 0x[0-9a-fA-F]+")
+# Cache sparsowanych plików układu z PDFY_DIR (zmieniane tylko przez /api/wano/pdf-library/replace)
+LAYOUT_CACHE_MAX_BYTES = int(float(os.environ.get("WANO_LAYOUT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+# Szacunkowy narzut pamięci jednego rozwiązanego obiektu PDF w readerze (słowniki, nazwy, referencje)
+LAYOUT_OBJECT_OVERHEAD = int(os.environ.get("WANO_LAYOUT_OBJECT_OVERHEAD", "2048"))
+# Mnożnik surowego rozmiaru, gdy liczby obiektów nie da się odczytać z tablicy xref
+LAYOUT_PARSED_FACTOR = float(os.environ.get("WANO_LAYOUT_PARSED_FACTOR", "4"))
+_LAYOUT_CACHE: "OrderedDict[str, dict]" = OrderedDict()
+_LAYOUT_CACHE_LOCK = threading.Lock()
+_SHEET_REF_RE = re.compile(r"(?:'((?:[^']|'')+)'|([^\s'!=(),;:+\-*/&^<>\[\]]+))!")
 
 
 class GenerationError(Exception):
@@ -80,21 +131,213 @@ def _validate_assets(language_token: str, excel_path: Optional[str] = None):
             raise GenerationError(f"Brak wymaganych plików PDF: {path}")
 
 
-def _merge_pdf_list(paths: Iterable[str], output_file: str, cancel_event: Optional[threading.Event] = None) -> str:
+def _merge_pdf_list(
+    paths: Iterable[str],
+    output_file: str,
+    cancel_event: Optional[threading.Event] = None,
+    with_footer: bool = False,
+) -> str:
+    """Scala pliki PDF i (opcjonalnie) nakłada stopkę w tym samym przebiegu — wynik zapisywany jest raz."""
     _check_cancel(cancel_event)
-    os.makedirs(os.path.dirname(os.path.abspath(output_file)) or ".", exist_ok=True)
-    merger = PdfMerger()
+    output_dir = os.path.dirname(os.path.abspath(output_file)) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    if with_footer:
+        _require_reportlab()
+    writer = PdfWriter()
+    temp_path = None
     try:
         for p in paths:
             _check_cancel(cancel_event)
-            merger.append(os.path.abspath(p))
-        merger.write(output_file)
+            # Końcowy dokument nigdy nie miał zakładek (wcześniej ginęły przy nakładaniu stopki).
+            layout = _cached_layout(p)
+            if layout is None:
+                writer.append(os.path.abspath(p), import_outline=False)
+            else:
+                with layout["lock"]:
+                    writer.append(layout["reader"], import_outline=False)
+
+        total_pages = len(writer.pages)
+        if with_footer and total_pages > FOOTER_START_PAGE_INDEX + FOOTER_SKIP_LAST:
+            _check_cancel(cancel_event)
+            _FooterStamper(writer).stamp(range(FOOTER_START_PAGE_INDEX, total_pages - FOOTER_SKIP_LAST))
+
+        _check_cancel(cancel_event)
+        removed = _dedupe_pdf_objects(writer)
+        logger.info("Scalono %s zduplikowanych obiektów PDF", removed)
+
+        _check_cancel(cancel_event)
+        temp_fd, temp_path = tempfile.mkstemp(prefix=".wano-merge-", suffix=".pdf.tmp", dir=output_dir)
+        with os.fdopen(temp_fd, "wb") as temp_file:
+            writer.write(temp_file)
+        os.replace(temp_path, output_file)
+        temp_path = None
         logger.info("Zapisano PDF: %s", output_file)
         return os.path.abspath(output_file)
+    except GenerationError:
+        raise
     except Exception as exc:
         raise GenerationError(f"Błąd scalania PDF: {exc}") from exc
     finally:
-        merger.close()
+        writer.close()
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Typy słowników, które można bezpiecznie współdzielić między stronami i częściami dokumentu
+_DEDUPE_DICT_TYPES = {"/Font", "/FontDescriptor", "/ExtGState", "/Encoding"}
+_COMPRESS_MIN_BYTES = 256
+
+
+def _dedupe_pdf_objects(writer: PdfWriter) -> int:
+    """Scala identyczne strumienie (fonty, obrazy, formularze) i słowniki fontów w PdfWriter.
+
+    Każdy eksport LibreOffice i każdy plik układu osadza te same fonty i grafiki od nowa. Obiekty są
+    porównywane po skrócie treści, w którym odwołania zastępuje skrót obiektu docelowego — dzięki temu
+    dwa słowniki fontu wskazujące na identyczne (ale osobne) pliki fontów również są uznane za równe.
+    Duplikaty zostają zastąpione obiektem null, a odwołania przepięte na pierwszy egzemplarz.
+    Przy okazji kompresowane są duże strumienie zapisane bez filtra.
+    """
+    objects = writer._objects
+    digests: dict[int, bytes] = {}
+    in_progress: set[int] = set()
+
+    def feed(h, value):
+        if isinstance(value, IndirectObject):
+            h.update(b"R")
+            h.update(object_digest(value.idnum))
+        elif isinstance(value, DictionaryObject):
+            h.update(b"<<")
+            for key in sorted(value.keys()):
+                if isinstance(value, StreamObject) and key == "/Length":
+                    continue
+                h.update(key.encode("utf-8", "surrogatepass"))
+                feed(h, value.raw_get(key))
+            h.update(b">>")
+        elif isinstance(value, ArrayObject):
+            h.update(b"[")
+            for item in value:
+                feed(h, item)
+            h.update(b"]")
+        else:
+            h.update(f"{type(value).__name__}:{value!r}".encode("utf-8", "surrogatepass"))
+        h.update(b"\x1f")
+
+    def object_digest(idnum: int) -> bytes:
+        if idnum in digests:
+            return digests[idnum]
+        if idnum in in_progress or not 0 < idnum <= len(objects):
+            # Cykl lub odwołanie spoza dokumentu — tożsamość obiektu jest częścią skrótu.
+            return b"@%d" % idnum
+        in_progress.add(idnum)
+        try:
+            obj = objects[idnum - 1]
+            h = hashlib.sha256()
+            feed(h, obj)
+            if isinstance(obj, StreamObject):
+                h.update(b"stream")
+                h.update(obj._data)
+            digests[idnum] = h.digest()
+        finally:
+            in_progress.discard(idnum)
+        return digests[idnum]
+
+    canonical: dict[bytes, int] = {}
+    remap: dict[int, int] = {}
+    for idx, obj in enumerate(objects):
+        idnum = idx + 1
+        if isinstance(obj, StreamObject):
+            if "/Filter" not in obj and len(obj._data) >= _COMPRESS_MIN_BYTES and obj.get("/Type") != "/Metadata":
+                obj = obj.flate_encode()
+                objects[idx] = obj
+        elif not (isinstance(obj, DictionaryObject) and obj.get("/Type") in _DEDUPE_DICT_TYPES):
+            continue
+        digest = object_digest(idnum)
+        first = canonical.setdefault(digest, idnum)
+        if first != idnum:
+            remap[idnum] = first
+
+    if not remap:
+        return 0
+
+    def relink(value):
+        if isinstance(value, DictionaryObject):
+            for key in list(value.keys()):
+                item = value.raw_get(key)
+                if isinstance(item, IndirectObject):
+                    if item.idnum in remap:
+                        value[key] = IndirectObject(remap[item.idnum], 0, writer)
+                else:
+                    relink(item)
+        elif isinstance(value, ArrayObject):
+            for pos, item in enumerate(value):
+                if isinstance(item, IndirectObject):
+                    if item.idnum in remap:
+                        value[pos] = IndirectObject(remap[item.idnum], 0, writer)
+                else:
+                    relink(item)
+
+    for obj in objects:
+        relink(obj)
+    for idnum in remap:
+        objects[idnum - 1] = NullObject()
+    return len(remap)
+
+
+def _estimate_parsed_size(reader: PdfReader, raw_size: int) -> int:
+    """Szacuje pamięć readera po rozwiązaniu wszystkich obiektów: surowe bajty + narzut na obiekt."""
+    try:
+        objects = sum(len(entries) for entries in reader.xref.values()) + len(reader.xref_objStm)
+    except Exception:
+        return int(raw_size * LAYOUT_PARSED_FACTOR)
+    return raw_size + objects * LAYOUT_OBJECT_OVERHEAD
+
+
+def _cached_layout(path: str) -> Optional[dict]:
+    """Zwraca wpis cache (reader + blokada) dla pliku z PDFY_DIR; None dla pozostałych plików.
+
+    Reader trzyma treść pliku w pamięci, a rozwiązane już obiekty zostają w nim między generacjami,
+    więc kolejne scalanie kopiuje gotowe obiekty zamiast ponownie parsować plik. Wpis jest odświeżany,
+    gdy zmieni się mtime lub rozmiar pliku. Limit LRU liczy szacowany rozmiar sparsowanego readera,
+    nie tylko surowych bajtów.
+    """
+    path = os.path.abspath(path)
+    base_dir = os.path.abspath(PDFY_DIR)
+    if not path.startswith(base_dir + os.sep):
+        return None
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _LAYOUT_CACHE_LOCK:
+        entry = _LAYOUT_CACHE.get(path)
+        if entry is not None and entry["signature"] == signature:
+            _LAYOUT_CACHE.move_to_end(path)
+            return entry
+    with open(path, "rb") as f:
+        data = f.read()
+    reader = PdfReader(BytesIO(data))
+    entry = {
+        "signature": signature,
+        "size": _estimate_parsed_size(reader, len(data)),
+        "reader": reader,
+        "lock": threading.Lock(),
+    }
+    with _LAYOUT_CACHE_LOCK:
+        _LAYOUT_CACHE[path] = entry
+        _LAYOUT_CACHE.move_to_end(path)
+        total = sum(item["size"] for item in _LAYOUT_CACHE.values())
+        # Wpis większy niż cały limit też wypada - zostanie użyty w tym scalaniu, ale nie jest trzymany
+        while total > LAYOUT_CACHE_MAX_BYTES and _LAYOUT_CACHE:
+            _, evicted = _LAYOUT_CACHE.popitem(last=False)
+            total -= evicted["size"]
+    return entry
+
+
+def invalidate_layout_cache(path: Optional[str] = None):
+    """Usuwa z cache plik układu (lub wszystkie) — np. po podmianie pliku w bibliotece PDF."""
+    with _LAYOUT_CACHE_LOCK:
+        if path is None:
+            _LAYOUT_CACHE.clear()
+        else:
+            _LAYOUT_CACHE.pop(os.path.abspath(path), None)
 
 
 def _require_reportlab():
@@ -110,63 +353,105 @@ def _get_footer_font_name() -> str:
     if _FOOTER_FONT_IN_USE:
         return _FOOTER_FONT_IN_USE
 
-    font_name = FOOTER_FONT
-    for path in FOOTER_PREFERRED_FONT_PATHS:
-        if os.path.exists(path):
-            try:
-                pdfmetrics.registerFont(TTFont(font_name, path))
-                _FOOTER_FONT_IN_USE = font_name
-                return _FOOTER_FONT_IN_USE
-            except Exception:
-                continue
-
-    _FOOTER_FONT_IN_USE = FOOTER_FALLBACK_FONT
-    return _FOOTER_FONT_IN_USE
-
+    with _FOOTER_FONT_LOCK:
+        if _FOOTER_FONT_IN_USE:
+            return _FOOTER_FONT_IN_USE
+        font_name = FOOTER_FONT
+        for path in FOOTER_PREFERRED_FONT_PATHS:
+            if os.path.exists(path):
+                try:
+                    pdfmetrics.registerFont(TTFont(font_name, path))
+                    _FOOTER_FONT_IN_USE = font_name
+                    return _FOOTER_FONT_IN_USE
+                except Exception:
+                    continue
 
-def _create_footer_overlay(page_width: float, page_height: float, page_number: int) -> BytesIO:
-    font_name = _get_footer_font_name()
-    overlay = BytesIO()
-    c = canvas.Canvas(overlay, pagesize=(page_width, page_height))
-    c.setFont(font_name, FOOTER_FONT_SIZE)
-    baseline = FOOTER_MARGIN_Y
-    c.drawString(FOOTER_MARGIN_X + 10, baseline, FOOTER_LEFT_TEXT)
-    c.drawCentredString(page_width / 2, baseline, str(page_number))
-    c.drawRightString(page_width - FOOTER_MARGIN_X - 10, baseline, FOOTER_RIGHT_TEXT)
-    c.save()
-    overlay.seek(0)
-    return overlay
+        _FOOTER_FONT_IN_USE = FOOTER_FALLBACK_FONT
+        return _FOOTER_FONT_IN_USE
 
 
-def _apply_footer_to_pdf(pdf_path: str, cancel_event: Optional[threading.Event] = None):
-    _require_reportlab()
-    _check_cancel(cancel_event)
-    if not os.path.exists(pdf_path):
-        raise GenerationError(f"Nie znaleziono pliku PDF do oznaczenia stopką: {pdf_path}")
+class _FooterStamper:
+    """Nakłada stopkę na strony PdfWriter bez ponownego parsowania i zapisu całego dokumentu.
 
-    reader = PdfReader(pdf_path)
-    total_pages = len(reader.pages)
-    if total_pages <= FOOTER_START_PAGE_INDEX + FOOTER_SKIP_LAST:
-        return  # zbyt mały dokument, nie ma czego oznaczać
+    Stała część stopki (telefon, e-mail) to jeden Form XObject na rozmiar strony, numery stron
+    pochodzą z jednego dokumentu nakładki, a strony dzielą ten sam strumień treści — różni je
+    tylko wpis /WanoPageNumber w zasobach.
+    """
 
-    writer = PdfWriter()
-    for idx, page in enumerate(reader.pages):
-        _check_cancel(cancel_event)
-        page_number = idx + 1
-        if idx >= FOOTER_START_PAGE_INDEX and idx < total_pages - FOOTER_SKIP_LAST:
-            overlay_stream = _create_footer_overlay(float(page.mediabox.width), float(page.mediabox.height), page_number)
-            overlay_pdf = PdfReader(overlay_stream)
-            page.merge_page(overlay_pdf.pages[0])
-        writer.add_page(page)
-
-    temp_fd, temp_path = tempfile.mkstemp(prefix="wano-footer-", suffix=".pdf")
-    try:
-        with os.fdopen(temp_fd, "wb") as temp_file:
-            writer.write(temp_file)
-        shutil.move(temp_path, pdf_path)
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    STATIC_NAME = NameObject("/WanoFooter")
+    NUMBER_NAME = NameObject("/WanoPageNumber")
+
+    def __init__(self, writer: PdfWriter):
+        self.writer = writer
+
+    def _stream(self, data: bytes) -> IndirectObject:
+        stream = DecodedStreamObject()
+        stream.set_data(data)
+        return self.writer._add_object(stream)
+
+    def _as_xobject(self, overlay_page) -> IndirectObject:
+        form = DecodedStreamObject()
+        form.set_data(overlay_page.get_contents().get_data())
+        form = form.flate_encode()
+        form[NameObject("/Type")] = NameObject("/XObject")
+        form[NameObject("/Subtype")] = NameObject("/Form")
+        form[NameObject("/BBox")] = ArrayObject(overlay_page.mediabox)
+        form[NameObject("/Resources")] = overlay_page["/Resources"].clone(self.writer)
+        return self.writer._add_object(form)
+
+    def _render_overlay(self, sizes: List[tuple[float, float]], numbered: List[tuple[int, float, float]]) -> PdfReader:
+        font_name = _get_footer_font_name()
+        overlay = BytesIO()
+        c = canvas.Canvas(overlay)
+        baseline = FOOTER_MARGIN_Y
+        for width, height in sizes:
+            c.setPageSize((width, height))
+            c.setFont(font_name, FOOTER_FONT_SIZE)
+            c.drawString(FOOTER_MARGIN_X + 10, baseline, FOOTER_LEFT_TEXT)
+            c.drawRightString(width - FOOTER_MARGIN_X - 10, baseline, FOOTER_RIGHT_TEXT)
+            c.showPage()
+        for page_number, width, height in numbered:
+            c.setPageSize((width, height))
+            c.setFont(font_name, FOOTER_FONT_SIZE)
+            c.drawCentredString(width / 2, baseline, str(page_number))
+            c.showPage()
+        c.save()
+        overlay.seek(0)
+        return PdfReader(overlay)
+
+    def stamp(self, page_indices: Iterable[int]):
+        pages = [(idx, self.writer.pages[idx]) for idx in page_indices]
+        if not pages:
+            return
+        page_sizes = {idx: (float(page.mediabox.width), float(page.mediabox.height)) for idx, page in pages}
+        sizes = sorted(set(page_sizes.values()))
+        overlay = self._render_overlay(sizes, [(idx + 1, *page_sizes[idx]) for idx, _ in pages])
+
+        static_forms = {size: self._as_xobject(overlay.pages[pos]) for pos, size in enumerate(sizes)}
+        prefix = self._stream(b"q\n")
+        suffix = self._stream(
+            b"Q\nq " + self.STATIC_NAME.encode() + b" Do Q\nq " + self.NUMBER_NAME.encode() + b" Do Q\n"
+        )
+        for pos, (idx, page) in enumerate(pages):
+            number_form = self._as_xobject(overlay.pages[len(sizes) + pos])
+
+            # Płytkie kopie — zasoby bywają współdzielone między stronami jednego źródła.
+            resources = DictionaryObject(page.get("/Resources", DictionaryObject()))
+            xobjects = DictionaryObject(resources.get("/XObject", DictionaryObject()))
+            xobjects[self.STATIC_NAME] = static_forms[page_sizes[idx]]
+            xobjects[self.NUMBER_NAME] = number_form
+            resources[NameObject("/XObject")] = xobjects
+            page[NameObject("/Resources")] = resources
+
+            contents = page.raw_get("/Contents") if "/Contents" in page else None
+            resolved = contents.get_object() if contents is not None else None
+            if isinstance(resolved, ArrayObject):
+                parts = list(resolved)
+            elif contents is not None:
+                parts = [contents]
+            else:
+                parts = []
+            page[NameObject("/Contents")] = ArrayObject([prefix, *parts, suffix])
 
 
 def _find_soffice_binary() -> str:
@@ -188,26 +473,7 @@ def _find_soffice_binary() -> str:
     )
 
 
-def _convert_excel_to_pdf(
-    excel_path: str, dest_dir: str, cancel_event: Optional[threading.Event] = None
-) -> str:
-    _check_cancel(cancel_event)
-    os.makedirs(dest_dir, exist_ok=True)
-    excel_abs = os.path.abspath(excel_path)
-    out_name = os.path.splitext(os.path.basename(excel_abs))[0] + ".pdf"
-    out_path = os.path.join(dest_dir, out_name)
-
-    soffice = _find_soffice_binary()
-
-    cmd = [
-        soffice,
-        "--headless",
-        "--convert-to",
-        "pdf",
-        "--outdir",
-        dest_dir,
-        excel_abs,
-    ]
+def _office_env() -> dict:
     env = os.environ.copy()
     default_paths = [
         "/usr/local/sbin",
@@ -223,30 +489,318 @@ def _convert_excel_to_pdf(
             env_paths.append(p)
     env["PATH"] = ":".join(env_paths)
     env["HOME"] = env.get("HOME", "/tmp")
+    return env
 
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-    stdout = b""
-    stderr = b""
+
+class _ForeignOfficeError(GenerationError):
+    """Raised when the office answering on our port was not spawned by this instance."""
+
+
+def _import_uno():
     try:
+        import uno
+        import unohelper
+        from com.sun.star.beans import PropertyValue
+    except ImportError:
+        return None
+    return uno, unohelper, PropertyValue
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _OfficeInstance:
+    """Długo żyjący proces soffice nasłuchujący na własnym porcie, z własnym profilem.
+
+    Przy ``fixed_port`` równym 0 port jest wybierany przy każdym starcie, więc pule w różnych
+    procesach nie konkurują o te same porty.
+    """
+
+    def __init__(self, fixed_port: int = 0):
+        self.fixed_port = fixed_port
+        self.port = fixed_port
+        self.profile_dir: Optional[str] = None
+        self.proc: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.broken = False
+        self.last_check = 0.0
+
+    def _connect(self):
+        uno, _, _ = _import_uno()
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local_ctx)
+        ctx = resolver.resolve(f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+        smgr = ctx.getServiceManager()
+        if not self._owns(smgr, ctx):
+            raise _ForeignOfficeError(f"Na porcie {self.port} nasłuchuje LibreOffice innego procesu.")
+        return smgr.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def _owns(self, smgr, ctx) -> bool:
+        """Sprawdza po katalogu profilu, czy połączony soffice to proces uruchomiony przez tę instancję."""
+        _, unohelper, _ = _import_uno()
+        try:
+            paths = smgr.createInstanceWithContext("com.sun.star.util.PathSettings", ctx)
+            user_config = paths.getPropertyValue("UserConfig")
+        except Exception:
+            return False
+        profile_url = unohelper.systemPathToFileUrl(self.profile_dir).rstrip("/") + "/"
+        return str(user_config).startswith(profile_url)
+
+    def start(self, cancel_event: Optional[threading.Event] = None):
+        self.stop()
+        soffice = _find_soffice_binary()
+        self.port = self.fixed_port or _free_port()
+        self.profile_dir = tempfile.mkdtemp(prefix=f"lo-profile-{self.port}-")
+        office_cmd = [
+            soffice,
+            "--headless",
+            "--invisible",
+            "--nologo",
+            "--nodefault",
+            "--norestore",
+            "--nofirststartwizard",
+            f"-env:UserInstallation=file://{self.profile_dir}",
+            f"--accept=socket,host=127.0.0.1,port={self.port};urp;",
+        ]
+        self.proc = subprocess.Popen(
+            office_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=_office_env()
+        )
+        deadline = time.monotonic() + OFFICE_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if cancel_event and cancel_event.is_set():
+                self.stop()
+                _check_cancel(cancel_event)
+            if self.proc.poll() is not None:
+                break
+            try:
+                self.desktop = self._connect()
+                self.broken = False
+                self.last_check = time.monotonic()
+                logger.info("LibreOffice gotowy na porcie %s", self.port)
+                return
+            except _ForeignOfficeError:
+                # Port zajęty przez cudzą instancję — nie wolno jej używać ani zamykać.
+                break
+            except Exception:
+                time.sleep(0.1)
+        self.stop()
+        raise GenerationError(f"Nie udało się uruchomić LibreOffice na porcie {self.port}.")
+
+    def is_healthy(self) -> bool:
+        if self.broken or self.proc is None or self.desktop is None:
+            return False
+        if self.proc.poll() is not None:
+            return False
+        if time.monotonic() - self.last_check < OFFICE_HEALTH_INTERVAL:
+            return True
+        try:
+            self.desktop.getComponents()
+        except Exception:
+            return False
+        self.last_check = time.monotonic()
+        return True
+
+    def ensure_running(self, cancel_event: Optional[threading.Event] = None):
+        if not self.is_healthy():
+            if self.proc is not None:
+                logger.warning("Restart LibreOffice na porcie %s", self.port)
+            self.start(cancel_event)
+
+    def load(self, path: str):
+        _, unohelper, PropertyValue = _import_uno()
+        url = unohelper.systemPathToFileUrl(os.path.abspath(path))
+        load_props = (PropertyValue("Hidden", 0, True, 0),)
+        return self.desktop.loadComponentFromURL(url, "_blank", 0, load_props)
+
+    def store(self, doc, target_path: str, filter_name: str):
+        _, unohelper, PropertyValue = _import_uno()
+        url = unohelper.systemPathToFileUrl(os.path.abspath(target_path))
+        doc.storeToURL(url, (PropertyValue("FilterName", 0, filter_name, 0),))
+
+    def convert_to_pdf(self, source_path: str, target_pdf: str):
+        doc = self.load(source_path)
+        if doc is None:
+            raise GenerationError(f"LibreOffice nie otworzył pliku: {source_path}")
+        try:
+            self.store(doc, target_pdf, "calc_pdf_Export")
+        finally:
+            _close_uno_doc(doc)
+
+    def stop(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+        if self.proc is not None:
+            if self.proc.poll() is None:
+                self.proc.terminate()
+                try:
+                    self.proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.proc.kill()
+            self.proc = None
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+
+class OfficePool:
+    """Pula ciepłych instancji LibreOffice z kontrolą stanu i restartem po awarii."""
+
+    def __init__(self, size: int = OFFICE_POOL_SIZE, base_port: int = OFFICE_BASE_PORT):
+        self._instances = [_OfficeInstance(base_port + idx if base_port else 0) for idx in range(size)]
+        self._idle: "queue.Queue[_OfficeInstance]" = queue.Queue()
+        for instance in self._instances:
+            self._idle.put(instance)
+
+    @property
+    def size(self) -> int:
+        return len(self._instances)
+
+    @contextmanager
+    def acquire(self, cancel_event: Optional[threading.Event] = None):
         while True:
+            _check_cancel(cancel_event)
             try:
-                stdout, stderr = proc.communicate(timeout=0.5)
+                instance = self._idle.get(timeout=0.5)
                 break
-            except subprocess.TimeoutExpired:
-                _check_cancel(cancel_event)
+            except queue.Empty:
                 continue
-    except GenerationCancelled:
-        proc.terminate()
         try:
-            proc.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            proc.kill()
-        raise
+            instance.ensure_running(cancel_event)
+            yield instance
+        except Exception:
+            # Stan instancji po błędzie jest niepewny — przy następnym użyciu zostanie zrestartowana.
+            instance.broken = True
+            raise
+        finally:
+            self._idle.put(instance)
+
+    def warm_up(self):
+        for _ in range(self.size):
+            with self.acquire():
+                pass
+
+    def shutdown(self):
+        for instance in self._instances:
+            instance.stop()
+
+
+_OFFICE_POOL: Optional[OfficePool] = None
+_OFFICE_POOL_LOCK = threading.Lock()
+
+
+def _get_office_pool() -> Optional[OfficePool]:
+    global _OFFICE_POOL
+    if _import_uno() is None:
+        return None
+    with _OFFICE_POOL_LOCK:
+        if _OFFICE_POOL is None:
+            _OFFICE_POOL = OfficePool()
+        return _OFFICE_POOL
+
+
+def warm_up_office_pool() -> bool:
+    """Uruchamia instancje LibreOffice z wyprzedzeniem (np. przy starcie serwera)."""
+    pool = _get_office_pool()
+    if pool is None:
+        return False
+    try:
+        pool.warm_up()
+    except GenerationError as exc:
+        logger.warning("Nie udało się rozgrzać puli LibreOffice: %s", exc)
+        return False
+    return True
+
+
+def shutdown_office_pool():
+    global _OFFICE_POOL
+    with _OFFICE_POOL_LOCK:
+        if _OFFICE_POOL is not None:
+            _OFFICE_POOL.shutdown()
+            _OFFICE_POOL = None
+
+
+atexit.register(shutdown_office_pool)
+
+
+def _close_uno_doc(doc):
+    try:
+        doc.close(True)
+    except Exception:
+        pass
+
+
+def _convert_excel_to_pdf_cli(excel_abs: str, dest_dir: str, cancel_event: Optional[threading.Event] = None):
+    soffice = _find_soffice_binary()
+    # Równoległe wywołania na wspólnym profilu kończą się bez pliku wynikowego — każde dostaje własny profil.
+    profile_dir = tempfile.mkdtemp(prefix="lo-profile-cli-")
+
+    cmd = [
+        soffice,
+        "--headless",
+        f"-env:UserInstallation=file://{profile_dir}",
+        "--convert-to",
+        "pdf",
+        "--outdir",
+        dest_dir,
+        excel_abs,
+    ]
+    stdout = b""
+    stderr = b""
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=_office_env())
+        try:
+            while True:
+                try:
+                    stdout, stderr = proc.communicate(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    _check_cancel(cancel_event)
+                    continue
+        except GenerationCancelled:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            raise
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
 
     if proc.returncode != 0:
         stderr_msg = stderr.decode(errors="ignore") if stderr else stdout.decode(errors="ignore")
         raise GenerationError(f"Konwersja przez libreoffice nie powiodła się: {stderr_msg}")
 
+
+def _convert_excel_to_pdf(
+    excel_path: str, dest_dir: str, cancel_event: Optional[threading.Event] = None
+) -> str:
+    _check_cancel(cancel_event)
+    os.makedirs(dest_dir, exist_ok=True)
+    excel_abs = os.path.abspath(excel_path)
+    out_name = os.path.splitext(os.path.basename(excel_abs))[0] + ".pdf"
+    out_path = os.path.join(dest_dir, out_name)
+
+    pool = _get_office_pool()
+    converted = False
+    if pool is not None:
+        try:
+            with pool.acquire(cancel_event) as office:
+                office.convert_to_pdf(excel_abs, out_path)
+            converted = True
+        except GenerationCancelled:
+            raise
+        except Exception as exc:
+            logger.warning("Konwersja w puli LibreOffice nieudana (%s), używam soffice --convert-to", exc)
+    if not converted:
+        _convert_excel_to_pdf_cli(excel_abs, dest_dir, cancel_event)
+
     _check_cancel(cancel_event)
     if not os.path.exists(out_path):
         raise GenerationError(f"Nie znaleziono wyjściowego PDF: {out_path}")
@@ -258,117 +812,367 @@ def _export_sheet_uno(
 ) -> Optional[str]:
     """Eksport arkusza przez UNO, usuwając inne arkusze i zachowując grafiki."""
     _check_cancel(cancel_event)
-    try:
-        import uno
-        import unohelper
-        from com.sun.star.beans import PropertyValue
-    except ImportError:
+    pool = _get_office_pool()
+    if pool is None:
         logger.warning("UNO not available; skipping UNO export for %s", sheet_name)
         return None
 
-    soffice = _find_soffice_binary()
-    _check_cancel(cancel_event)
     os.makedirs(os.path.dirname(os.path.abspath(target_pdf)) or ".", exist_ok=True)
-    tmp_profile = tempfile.mkdtemp(prefix="lo-profile-")
-    office_cmd = [
-        soffice,
-        "--headless",
-        "--nologo",
-        "--nodefault",
-        "--nofirststartwizard",
-        f"-env:UserInstallation=file://{tmp_profile}",
-        "--accept=socket,host=127.0.0.1,port=2002;urp;",
-    ]
-    office_proc = subprocess.Popen(office_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    def _connect():
-        local_ctx = uno.getComponentContext()
-        resolver = local_ctx.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local_ctx)
-        return resolver.resolve("uno:socket,host=127.0.0.1,port=2002;urp;StarOffice.ComponentContext")
-
-    ctx = None
-    for _ in range(40):
-        try:
+    temp_dir = tempfile.mkdtemp(prefix="wano-uno-")
+    try:
+        with pool.acquire(cancel_event) as office:
             _check_cancel(cancel_event)
-            ctx = _connect()
-            break
-        except Exception:
-            import time
+            doc = office.load(excel_path)
+            if doc is None:
+                return None
+            try:
+                _check_cancel(cancel_event)
+                sheets = doc.Sheets
+                if not sheets.hasByName(sheet_name):
+                    return None
+                # Usuń wszystkie arkusze poza docelowym
+                for name in list(sheets.ElementNames):
+                    _check_cancel(cancel_event)
+                    if name != sheet_name:
+                        try:
+                            sheets.removeByName(name)
+                        except Exception:
+                            pass
+                # Ustaw aktywny arkusz na jedyny
+                doc.CurrentController.setActiveSheet(sheets.getByName(sheet_name))
+
+                # Zapisz kopię z jednym arkuszem
+                single_path = os.path.join(temp_dir, os.path.basename(excel_path))
+                office.store(doc, single_path, "Calc Office Open XML")
+            finally:
+                _close_uno_doc(doc)
+
+            # Konwersja tej kopii do PDF w tej samej, ciepłej instancji
+            _check_cancel(cancel_event)
+            office.convert_to_pdf(single_path, target_pdf)
+        if os.path.exists(target_pdf):
+            return target_pdf
+    except GenerationCancelled:
+        raise
+    except Exception as exc:
+        logger.warning("UNO export failed for %s: %s", sheet_name, exc)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return None
 
-            time.sleep(0.1)
-    if ctx is None:
-        office_proc.terminate()
-        return None
 
-    smgr = ctx.getServiceManager()
-    desktop = smgr.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+def _export_sheets_single_load(
+    excel_path: str,
+    targets: List[tuple[str, str]],
+    cancel_event: Optional[threading.Event] = None,
+    on_exported: Optional[Callable[[str, str], None]] = None,
+) -> List[str]:
+    """Eksport wielu arkuszy z jednego wczytania skoroszytu — pozostałe arkusze są kolejno ukrywane.
 
-    source_url = unohelper.systemPathToFileUrl(os.path.abspath(excel_path))
-    load_props = (PropertyValue("Hidden", 0, True, 0),)
+    targets to lista (nazwa arkusza, docelowy PDF). Zwraca nazwy arkuszy wyeksportowanych poprawnie;
+    pozostałe wywołujący eksportuje ścieżką zapasową.
+    """
     _check_cancel(cancel_event)
-    doc = desktop.loadComponentFromURL(source_url, "_blank", 0, load_props)
-    if doc is None:
-        desktop.terminate()
-        office_proc.terminate()
-        return None
+    pool = _get_office_pool()
+    if pool is None or not targets:
+        return []
 
-    single_path = None
+    exported: List[str] = []
     try:
-        _check_cancel(cancel_event)
-        sheets = doc.Sheets
-        if not sheets.hasByName(sheet_name):
+        with pool.acquire(cancel_event) as office:
+            doc = office.load(excel_path)
+            if doc is None:
+                return exported
+            try:
+                sheets = doc.Sheets
+                names = list(sheets.ElementNames)
+                for sheet_name, target_pdf in targets:
+                    _check_cancel(cancel_event)
+                    if not sheets.hasByName(sheet_name):
+                        continue
+                    # Arkusz docelowy musi być widoczny zanim ukryjemy resztę (Calc wymaga jednego widocznego).
+                    target_sheet = sheets.getByName(sheet_name)
+                    target_sheet.IsVisible = True
+                    doc.CurrentController.setActiveSheet(target_sheet)
+                    for name in names:
+                        if name != sheet_name:
+                            sheets.getByName(name).IsVisible = False
+                    os.makedirs(os.path.dirname(os.path.abspath(target_pdf)) or ".", exist_ok=True)
+                    office.store(doc, target_pdf, "calc_pdf_Export")
+                    if os.path.exists(target_pdf):
+                        exported.append(sheet_name)
+                        if on_exported:
+                            on_exported(sheet_name, target_pdf)
+            finally:
+                _close_uno_doc(doc)
+    except GenerationCancelled:
+        raise
+    except Exception as exc:
+        logger.warning("Eksport arkuszy z jednego wczytania nieudany: %s", exc)
+    return exported
+
+
+class _ReusableImageData(BytesIO):
+    """Dane obrazu, których openpyxl nie zamknie przy zapisie (ten sam skoroszyt zapisujemy wiele razy)."""
+
+    def close(self):
+        pass
+
+
+def _keep_images_reusable(wb):
+    for ws in wb.worksheets:
+        for image in getattr(ws, "_images", []):
+            ref = image.ref
+            if isinstance(ref, _ReusableImageData) or not hasattr(ref, "read"):
+                continue
+            ref.seek(0)
+            image.ref = _ReusableImageData(ref.read())
+
+
+def _save_single_sheet_copy(wb, sheet_name: str, target_path: str):
+    """Zapisuje kopię skoroszytu z jednym widocznym arkuszem, bez ponownego parsowania pliku."""
+    _keep_images_reusable(wb)
+    all_sheets = wb.worksheets + wb.chartsheets
+    states = {ws.title: ws.sheet_state for ws in all_sheets}
+    active_index = wb.index(wb.active) if wb.active is not None else 0
+    try:
+        target = wb[sheet_name]
+        target.sheet_state = "visible"
+        wb.active = target
+        for ws in all_sheets:
+            if ws.title != sheet_name:
+                ws.sheet_state = "hidden"
+        wb.save(target_path)
+    finally:
+        for ws in all_sheets:
+            ws.sheet_state = states[ws.title]
+        wb.active = active_index
+
+
+def _file_digest(path: str) -> str:
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    cached = _FILE_DIGESTS.get(path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _FILE_DIGESTS[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def _stable_value(value):
+    if type(value).__repr__ is object.__repr__:
+        # np. ArrayFormula — domyślny repr zawiera adres obiektu
+        return type(value).__name__, sorted((k, repr(v)) for k, v in vars(value).items())
+    return value
+
+
+def _sheet_own_digest(wb, ws) -> tuple[str, set[str], bool]:
+    """Hash wartości, stylów, grafik i ustawień wydruku arkusza, nazwy arkuszy, do których odwołują się formuły,
+    oraz znacznik formuł ulotnych (TODAY(), NOW()…)."""
+    h = hashlib.sha256()
+    refs: set[str] = set()
+    volatile = False
+    style_reprs: dict = {}
+
+    def feed(*parts):
+        for part in parts:
+            if hasattr(part, "to_tree"):
+                text = tostring(part.to_tree())
+            else:
+                # repr zagnieżdżonych obiektów bywa z adresem pamięci — nie może on wpływać na klucz
+                text = _OBJECT_ADDRESS_RE.sub("", repr(part)).encode("utf-8", "surrogatepass")
+            h.update(text)
+            h.update(b"\x1f")
+
+    for (row, col), cell in sorted(ws._cells.items()):
+        value = cell.value
+        if isinstance(value, str) and value.startswith("="):
+            volatile = volatile or bool(_VOLATILE_FUNC_RE.search(value))
+            for match in _SHEET_REF_RE.finditer(value):
+                refs.add(match.group(1).replace("''", "'") if match.group(1) else match.group(2))
+        style_key = tuple(cell._style)
+        if style_key not in style_reprs:
+            style_reprs[style_key] = repr(
+                (cell.font, cell.fill, cell.border, cell.alignment, cell.protection, cell.number_format)
+            )
+        feed(
+            row,
+            col,
+            _stable_value(value),
+            style_reprs[style_key],
+            cell.hyperlink.target if cell.hyperlink else None,
+            cell.comment.text if cell.comment else None,
+        )
+
+    for key, dim in sorted(ws.column_dimensions.items()):
+        feed("col", key, dim.min, dim.max, dim.width, dim.hidden, dim.outlineLevel, dim.style)
+    for key, dim in sorted(ws.row_dimensions.items()):
+        feed("row", key, dim.ht, dim.hidden, dim.outlineLevel, dim.style)
+    feed(sorted(str(rng) for rng in ws.merged_cells.ranges))
+    feed(
+        ws.sheet_state,
+        ws.print_area,
+        ws.print_title_rows,
+        ws.print_title_cols,
+        ws.page_setup,
+        ws.print_options,
+        ws.page_margins,
+        ws.HeaderFooter,
+        ws.sheet_properties,
+        ws.sheet_format,
+        ws.row_breaks,
+        ws.col_breaks,
+    )
+    for cf in ws.conditional_formatting:
+        feed(str(cf.sqref), [repr(rule) for rule in cf.rules])
+    for image in ws._images:
+        feed("img", image.anchor, image.width, image.height, hashlib.sha256(image._data()).hexdigest())
+    for chart in ws._charts:
+        feed("chart", chart.anchor, tostring(chart._write()))
+    feed(sorted((name, dn.attr_text) for name, dn in ws.defined_names.items()))
+    volatile = volatile or any(_VOLATILE_FUNC_RE.search(dn.attr_text or "") for dn in ws.defined_names.values())
+    return h.hexdigest(), refs, volatile
+
+
+def _workbook_style_digest(wb) -> str:
+    """Hash motywu i stylów nazwanych — kolory i czcionki motywu zmieniają wygląd komórek bez zmiany ich stylu."""
+    h = hashlib.sha256()
+    h.update(wb.loaded_theme or b"")
+    for style in wb._named_styles:
+        text = repr(
+            (
+                style.name,
+                style.font,
+                style.fill,
+                style.border,
+                style.alignment,
+                style.number_format,
+                style.protection,
+                style.builtinId,
+                style.hidden,
+            )
+        )
+        h.update(_OBJECT_ADDRESS_RE.sub("", text).encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def _sheet_cache_key(wb, sheet_name: str, layout_pdf: str, memo: dict) -> Optional[str]:
+    """Klucz cache dla arkusza; None, gdy arkusza nie da się wiarygodnie opisać lub zawiera (pośrednio)
+    formuły ulotne — wtedy zawsze eksport."""
+
+    def own(name: str):
+        if name not in memo:
+            memo[name] = _sheet_own_digest(wb, wb[name])
+        return memo[name]
+
+    try:
+        h = hashlib.sha256()
+        h.update(f"v{_EXPORT_CACHE_VERSION}|{EXPORT_MODE}|{sheet_name}".encode())
+        if ("workbook-styles",) not in memo:
+            memo[("workbook-styles",)] = _workbook_style_digest(wb)
+        h.update(f"|styles:{memo[('workbook-styles',)]}".encode())
+        if any(_VOLATILE_FUNC_RE.search(dn.attr_text or "") for dn in wb.defined_names.values()):
             return None
-        # Usuń wszystkie arkusze poza docelowym
-        for name in list(sheets.ElementNames):
-            _check_cancel(cancel_event)
-            if name != sheet_name:
-                try:
-                    sheets.removeByName(name)
-                except Exception:
-                    pass
-        # Ustaw aktywny arkusz na jedyny
-        doc.CurrentController.setActiveSheet(sheets.getByName(sheet_name))
-
-        # Zapisz kopię z jednym arkuszem
-        temp_dir = tempfile.mkdtemp(prefix="wano-uno-")
-        single_path = os.path.join(temp_dir, os.path.basename(excel_path))
-        single_url = unohelper.systemPathToFileUrl(single_path)
-        save_props = (PropertyValue("FilterName", 0, "Calc Office Open XML", 0),)
-        doc.storeToURL(single_url, save_props)
+        # Arkusze, do których prowadzą formuły (również pośrednio), wpływają na wyliczone wartości.
+        seen: set[str] = set()
+        stack = [sheet_name]
+        while stack:
+            name = stack.pop()
+            if name in seen or name not in wb.sheetnames:
+                continue
+            seen.add(name)
+            digest, refs, volatile = own(name)
+            if volatile:
+                return None
+            h.update(f"|{name}:{digest}".encode())
+            stack.extend(sorted(refs))
+        h.update(repr(sorted((name, dn.attr_text) for name, dn in wb.defined_names.items())).encode())
+        if os.path.exists(layout_pdf):
+            h.update(f"|layout:{_file_digest(layout_pdf)}".encode())
+        return h.hexdigest()
     except Exception as exc:
-        logger.warning("UNO export failed (prep) for %s: %s", sheet_name, exc)
-        try:
-            doc.close(True)
-        except Exception:
-            pass
-        try:
-            desktop.terminate()
-        except Exception:
-            pass
-        office_proc.terminate()
+        logger.warning("Nie można wyliczyć klucza cache dla %s: %s", sheet_name, exc)
         return None
-    finally:
-        try:
-            doc.close(True)
-        except Exception:
-            pass
-        try:
-            desktop.terminate()
-        except Exception:
-            pass
-        office_proc.terminate()
 
-    # Konwersja tej kopii do PDF (cały workbook ma już jeden arkusz)
-    if single_path:
-        try:
-            pdf_generated = _convert_excel_to_pdf(single_path, os.path.dirname(target_pdf), cancel_event)
-            if os.path.exists(pdf_generated):
-                shutil.move(pdf_generated, target_pdf)
-                return target_pdf
-        except Exception as exc:
-            logger.warning("UNO copy convert failed for %s: %s", sheet_name, exc)
-    return None
 
+def _export_cache_lookup(key: str) -> Optional[str]:
+    path = os.path.join(EXPORT_CACHE_DIR, f"{key}.pdf")
+    try:
+        os.utime(path)  # LRU — ostatnie użycie w mtime
+    except OSError:
+        return None
+    return path
+
+
+def _export_cache_store(key: str, pdf_path: str):
+    try:
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".pdf", dir=EXPORT_CACHE_DIR)
+        os.close(fd)
+        shutil.copyfile(pdf_path, temp_path)
+        os.replace(temp_path, os.path.join(EXPORT_CACHE_DIR, f"{key}.pdf"))
+        _evict_export_cache()
+    except OSError as exc:
+        logger.warning("Nie udało się zapisać arkusza w cache: %s", exc)
+
+
+def _evict_export_cache():
+    with _EXPORT_CACHE_LOCK:
+        entries = []
+        total = 0
+        for entry in os.scandir(EXPORT_CACHE_DIR):
+            if not entry.name.endswith(".pdf") or entry.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= EXPORT_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+class _LinkedCancel:
+    """Sygnał przerwania dla workerów: ustawiany lokalnie albo przez zewnętrzny cancel_event."""
+
+    def __init__(self, parent: Optional[threading.Event] = None):
+        self._parent = parent
+        self._own = threading.Event()
+
+    def set(self):
+        self._own.set()
+
+    def is_set(self) -> bool:
+        return self._own.is_set() or bool(self._parent and self._parent.is_set())
+
+
+def _run_export_tasks(executor: ThreadPoolExecutor, tasks: List[tuple], worker_cancel: _LinkedCancel):
+    """Uruchamia zadania eksportu równolegle; pierwszy błąd przerywa pozostałe i jest zgłaszany dalej."""
+    futures = [executor.submit(*task) for task in tasks]
+    if not futures:
+        return
+    done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+    errors = [f.exception() for f in done if f.exception() is not None]
+    if errors:
+        worker_cancel.set()
+        wait(futures)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        # Błąd właściwy ma pierwszeństwo przed przerwaniami wywołanymi przez worker_cancel.
+        errors.sort(key=lambda exc: isinstance(exc, GenerationCancelled))
+        raise errors[0]
 
 
 def _export_sheets(
@@ -378,6 +1182,17 @@ def _export_sheets(
     cancel_event: Optional[threading.Event] = None,
     register_cleanup: Optional[Callable[[str], None]] = None,
 ) -> List[str]:
+    return _export_sheet_sets([language_token], excel_path, progress_cb, cancel_event, register_cleanup)[language_token]
+
+
+def _export_sheet_sets(
+    language_tokens: List[str],
+    excel_path: Optional[str] = None,
+    progress_cb=None,
+    cancel_event: Optional[threading.Event] = None,
+    register_cleanup: Optional[Callable[[str], None]] = None,
+) -> dict[str, List[str]]:
+    """Eksportuje arkusze kilku języków z jednego parsowania i wczytania skoroszytu."""
     if load_workbook is None:
         raise GenerationError("Brak biblioteki openpyxl. Zainstaluj ją w venv (`pip install openpyxl`).")
 
@@ -390,70 +1205,203 @@ def _export_sheets(
         raise GenerationError(f"Nie można otworzyć skoroszytu: {exc}") from exc
 
     matched_sheets: List[tuple[str, str]] = []
-    sheet_patterns = re.compile(rf"^(\d+{language_token})")
-    for sheet in wb.sheetnames:
-        name = sheet.strip()
-        match = sheet_patterns.match(name)
-        if match:
-            matched_sheets.append((match.group(1), sheet))
+    for language_token in language_tokens:
+        token_sheets: List[tuple[str, str]] = []
+        sheet_patterns = re.compile(rf"^(\d+{language_token})")
+        for sheet in wb.sheetnames:
+            name = sheet.strip()
+            match = sheet_patterns.match(name)
+            if match:
+                token_sheets.append((match.group(1), sheet))
 
-    if not matched_sheets:
-        raise GenerationError(f"Nie znaleziono arkuszy pasujących do wzorca *{language_token} w skoroszycie.")
+        if not token_sheets:
+            raise GenerationError(f"Nie znaleziono arkuszy pasujących do wzorca *{language_token} w skoroszycie.")
 
-    matched_sheets.sort(key=lambda item: int(re.match(r"(\d+)", item[0]).group(1)))
+        token_sheets.sort(key=lambda item: int(re.match(r"(\d+)", item[0]).group(1)))
+        matched_sheets.extend(token_sheets)
 
     total = len(matched_sheets)
-    with tempfile.TemporaryDirectory() as temp_dir:
-        exported_prefixes: List[str] = []
-        for idx, (prefix, sheet_name) in enumerate(matched_sheets, start=1):
-            _check_cancel(cancel_event)
-            layout_pdf = os.path.join(PDFY_DIR, f"{prefix}.pdf")
-            num_prefix = int(re.match(r"(\d+)", prefix).group(1))
-            layout_required = num_prefix != 1
-            if layout_required and not os.path.exists(layout_pdf):
-                logger.warning("Pomijam arkusz %s - brak pliku układu: %s", sheet_name, layout_pdf)
-                if progress_cb:
-                    progress_cb("export", min(15 + int((idx / total) * 70), 90), f"Pomijam {sheet_name}")
-                continue
-            if not layout_required and not os.path.exists(layout_pdf):
-                logger.info("Używam Start%s jako layout dla %s", language_token, sheet_name)
+    pending: List[tuple[int, str, str]] = []
+    for idx, (prefix, sheet_name) in enumerate(matched_sheets, start=1):
+        layout_pdf = os.path.join(PDFY_DIR, f"{prefix}.pdf")
+        num_prefix = int(re.match(r"(\d+)", prefix).group(1))
+        layout_required = num_prefix != 1
+        if layout_required and not os.path.exists(layout_pdf):
+            logger.warning("Pomijam arkusz %s - brak pliku układu: %s", sheet_name, layout_pdf)
+            if progress_cb:
+                progress_cb("export", min(15 + int((idx / total) * 70), 90), f"Pomijam {sheet_name}")
+            continue
+        if not layout_required and not os.path.exists(layout_pdf):
+            logger.info("Używam Start%s jako layout dla %s", prefix.lstrip("0123456789"), sheet_name)
+        pending.append((idx, prefix, sheet_name))
+
+    cache_keys: dict[str, Optional[str]] = {}
+    if EXPORT_CACHE_ENABLED:
+        digest_memo: dict = {}
+        for _, prefix, sheet_name in pending:
+            cache_keys[prefix] = _sheet_cache_key(wb, sheet_name, os.path.join(PDFY_DIR, f"{prefix}.pdf"), digest_memo)
+
+    exported: set[str] = set()
+    finish_lock = threading.Lock()
+    wb_lock = threading.Lock()
+    done_count = [total - len(pending)]
+
+    def _finish_sheet(prefix: str, sheet_name: str, pdf_path: str, from_cache: bool = False):
+        final_pdf = os.path.join(EXPORT_DIR, f"{prefix}ex.pdf")
+        if from_cache:
+            shutil.copyfile(pdf_path, final_pdf)
+        else:
+            if cache_keys.get(prefix):
+                _export_cache_store(cache_keys[prefix], pdf_path)
+            shutil.move(pdf_path, final_pdf)
+        with finish_lock:
+            if register_cleanup:
+                register_cleanup(final_pdf)
+            exported.add(prefix)
+            done_count[0] += 1
+            pct = min(15 + int((done_count[0] / total) * 70), 90)
+            # Zgłaszane pod blokadą, żeby równoległe wątki nie cofały paska postępu
+            if progress_cb:
+                label = "Bez zmian (cache)" if from_cache else "Wyeksportowano"
+                progress_cb("export", pct, f"{label} {sheet_name}")
 
-            temp_pdf_path = os.path.join(temp_dir, f"{prefix}ex.pdf")
+    for _, prefix, sheet_name in pending:
+        key = cache_keys.get(prefix)
+        cached_pdf = _export_cache_lookup(key) if key else None
+        if cached_pdf:
+            _check_cancel(cancel_event)
+            try:
+                _finish_sheet(prefix, sheet_name, cached_pdf, from_cache=True)
+            except OSError as exc:
+                logger.warning("Nie udało się użyć cache dla %s: %s", sheet_name, exc)
+    to_export = [item for item in pending if item[1] not in exported]
+
+    def _export_fallback(prefix: str, sheet_name: str, temp_dir: str, worker_cancel):
+        _check_cancel(worker_cancel)
+        temp_pdf_path = os.path.join(temp_dir, f"{prefix}ex.pdf")
+        pdf_path = None
+        if EXPORT_MODE != "single":
             pdf_path = _export_sheet_uno(
                 source_excel,
                 sheet_name,
                 temp_pdf_path,
-                cancel_event=cancel_event,
+                cancel_event=worker_cancel,
             )
-            if pdf_path is None:
-                _check_cancel(cancel_event)
+        if pdf_path is None:
+            _check_cancel(worker_cancel)
+            # Osobny katalog na zadanie — konwersje równoległe nie nadpisują sobie plików.
+            job_dir = tempfile.mkdtemp(prefix=f"{prefix}-", dir=temp_dir)
+            temp_excel_path = os.path.join(job_dir, f"{prefix}.xlsm")
+            if EXPORT_MODE == "single":
+                with wb_lock:
+                    _save_single_sheet_copy(wb, sheet_name, temp_excel_path)
+            else:
                 temp_wb = load_workbook(source_excel, keep_vba=True)
                 if sheet_name not in temp_wb.sheetnames:
-                    continue
+                    return
                 for other in list(temp_wb.sheetnames):
-                    _check_cancel(cancel_event)
+                    _check_cancel(worker_cancel)
                     if other != sheet_name:
                         temp_wb.remove(temp_wb[other])
                 temp_wb.active = temp_wb[sheet_name]
-                temp_excel_path = os.path.join(temp_dir, f"{prefix}.xlsm")
                 temp_wb.save(temp_excel_path)
-                pdf_path = _convert_excel_to_pdf(temp_excel_path, temp_dir, cancel_event)
+            pdf_path = _convert_excel_to_pdf(temp_excel_path, job_dir, worker_cancel)
 
-            final_pdf = os.path.join(EXPORT_DIR, f"{prefix}ex.pdf")
-            shutil.move(pdf_path, final_pdf)
-            if register_cleanup:
-                register_cleanup(final_pdf)
+        _finish_sheet(prefix, sheet_name, pdf_path)
 
-            exported_prefixes.append(prefix)
-            if progress_cb:
-                progress_cb("export", min(15 + int((idx / total) * 70), 90), f"Wyeksportowano {sheet_name}")
+    workers = max(1, min(EXPORT_WORKERS, len(to_export) or 1))
+    worker_cancel = _LinkedCancel(cancel_event)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wano-export") as executor:
+            if EXPORT_MODE == "single" and to_export:
+                by_sheet = {sheet_name: prefix for _, prefix, sheet_name in to_export}
+                targets = [(sheet_name, os.path.join(temp_dir, f"{prefix}ex.pdf")) for _, prefix, sheet_name in to_export]
+                # Każdy worker wczytuje skoroszyt raz i eksportuje swoją część arkuszy.
+                chunks = [targets[i::workers] for i in range(workers)]
+                _run_export_tasks(
+                    executor,
+                    [
+                        (
+                            _export_sheets_single_load,
+                            source_excel,
+                            chunk,
+                            worker_cancel,
+                            lambda name, path: _finish_sheet(by_sheet[name], name, path),
+                        )
+                        for chunk in chunks
+                        if chunk
+                    ],
+                    worker_cancel,
+                )
+
+            _run_export_tasks(
+                executor,
+                [
+                    (_export_fallback, prefix, sheet_name, temp_dir, worker_cancel)
+                    for _, prefix, sheet_name in to_export
+                    if prefix not in exported
+                ],
+                worker_cancel,
+            )
 
-    if not exported_prefixes:
-        raise GenerationError(
-            f"Brak arkuszy z plikiem układu w {PDFY_DIR}. Upewnij się, że pliki *.pdf istnieją (np. 2{language_token}.pdf)."
-        )
+    result: dict[str, List[str]] = {}
+    for language_token in language_tokens:
+        exported_prefixes = [
+            prefix for _, prefix, _ in pending if prefix in exported and prefix.endswith(language_token)
+        ]
+        if not exported_prefixes:
+            raise GenerationError(
+                f"Brak arkuszy z plikiem układu w {PDFY_DIR}. Upewnij się, że pliki *.pdf istnieją (np. 2{language_token}.pdf)."
+            )
+        result[language_token] = exported_prefixes
 
-    return exported_prefixes
+    return result
+
+
+def _language_token(language: str) -> str:
+    language = language.lower()
+    if language not in {"pl", "en"}:
+        raise GenerationError("Język musi być 'pl' lub 'en'.")
+    return "PL" if language == "pl" else "EN"
+
+
+def _assemble_price_list(
+    language: str,
+    prefixes: List[str],
+    progress_cb=None,
+    cancel_event: Optional[threading.Event] = None,
+    register_cleanup: Optional[Callable[[str], None]] = None,
+) -> str:
+    token = _language_token(language)
+    output_file = OUTPUT_FILE_PL if language == "pl" else OUTPUT_FILE_EN
+
+    _check_cancel(cancel_event)
+    if progress_cb:
+        progress_cb("merge", 92, "Scalanie PDF i stopka")
+    parts = [os.path.join(PDFY_DIR, f"Start{token}.pdf")]
+    for prefix in prefixes:
+        _check_cancel(cancel_event)
+        sheet_pdf = os.path.join(EXPORT_DIR, f"{prefix}ex.pdf")
+        layout_pdf = os.path.join(PDFY_DIR, f"{prefix}.pdf")
+        if not os.path.exists(sheet_pdf):
+            raise GenerationError(f"Brak wygenerowanego PDF: {sheet_pdf}")
+        # Kolejność: Start -> 1ex -> 2.pdf + 2ex -> ... -> End
+        num_prefix = int(re.match(r"(\d+)", prefix).group(1))
+        if num_prefix == 1:
+            parts.append(sheet_pdf)
+            continue
+        if not os.path.exists(layout_pdf):
+            raise GenerationError(f"Brak pliku układu: {layout_pdf}")
+        parts.append(layout_pdf)
+        parts.append(sheet_pdf)
+    parts.append(os.path.join(PDFY_DIR, f"End{token}.pdf"))
+
+    target_dir = OUTPUT_DIR_PL if language == "pl" else OUTPUT_DIR_EN
+    os.makedirs(target_dir, exist_ok=True)
+    result = _merge_pdf_list(parts, output_file, cancel_event=cancel_event, with_footer=True)
+    if register_cleanup:
+        register_cleanup(result)
+    return result
 
 
 def generate_price_list(
@@ -468,11 +1416,7 @@ def generate_price_list(
     progress_cb(stage, percent, message) — opcjonalny callback do raportowania postępu.
     """
     language = language.lower()
-    if language not in {"pl", "en"}:
-        raise GenerationError("Język musi być 'pl' lub 'en'.")
-
-    token = "PL" if language == "pl" else "EN"
-    output_file = OUTPUT_FILE_PL if language == "pl" else OUTPUT_FILE_EN
+    token = _language_token(language)
 
     _check_cancel(cancel_event)
     if progress_cb:
@@ -491,38 +1435,64 @@ def generate_price_list(
         register_cleanup=register_cleanup,
     )
 
+    result = _assemble_price_list(language, prefixes, progress_cb, cancel_event, register_cleanup)
+    if progress_cb:
+        progress_cb("done", 100, "Gotowe")
+    return result
+
+
+def generate_price_lists(
+    languages: Iterable[str] = ("pl", "en"),
+    excel_path: Optional[str] = None,
+    progress_cb=None,
+    cancel_event: Optional[threading.Event] = None,
+    register_cleanup: Optional[Callable[[str], None]] = None,
+) -> dict[str, str]:
+    """Generuje cenniki kilku języków w jednym przebiegu: jedno parsowanie i wczytanie skoroszytu,
+    wspólny eksport arkuszy, a następnie równoległe scalanie dokumentów.
+
+    Zwraca słownik {język: ścieżka PDF}.
+    """
+    languages = [language.lower() for language in languages]
+    tokens = {language: _language_token(language) for language in languages}
+
     _check_cancel(cancel_event)
     if progress_cb:
-        progress_cb("merge", 92, "Scalanie PDF")
-    parts = [os.path.join(PDFY_DIR, f"Start{token}.pdf")]
-    for prefix in prefixes:
-        _check_cancel(cancel_event)
-        sheet_pdf = os.path.join(EXPORT_DIR, f"{prefix}ex.pdf")
-        layout_pdf = os.path.join(PDFY_DIR, f"{prefix}.pdf")
-        if not os.path.exists(sheet_pdf):
-            raise GenerationError(f"Brak wygenerowanego PDF: {sheet_pdf}")
-        # Kolejność: Start -> 1ex -> 2.pdf + 2ex -> ... -> End
-        num_prefix = int(re.match(r"(\d+)", prefix).group(1))
-        if num_prefix == 1:
-            parts.append(sheet_pdf)
-            continue
-        if not os.path.exists(layout_pdf):
-            raise GenerationError(f"Brak pliku układu: {layout_pdf}")
-        parts.append(layout_pdf)
-        parts.append(sheet_pdf)
-    parts.append(os.path.join(PDFY_DIR, f"End{token}.pdf"))
+        progress_cb("start", 5, "Start generowania")
+
+    for token in tokens.values():
+        _validate_assets(token, excel_path)
+    _check_cancel(cancel_event)
 
-    target_dir = OUTPUT_DIR_PL if language == "pl" else OUTPUT_DIR_EN
-    os.makedirs(target_dir, exist_ok=True)
-    result = _merge_pdf_list(parts, output_file, cancel_event=cancel_event)
     if progress_cb:
-        progress_cb("merge", 96, "Dodawanie stopki")
-    _apply_footer_to_pdf(result, cancel_event=cancel_event)
-    if register_cleanup:
-        register_cleanup(result)
+        progress_cb("export", 10, "Eksport arkuszy")
+    prefixes = _export_sheet_sets(
+        list(tokens.values()),
+        excel_path,
+        progress_cb,
+        cancel_event=cancel_event,
+        register_cleanup=register_cleanup,
+    )
+
+    def _language_progress(language: str):
+        if not progress_cb:
+            return None
+        return lambda stage, pct, msg: progress_cb(stage, pct, f"{language.upper()}: {msg}")
+
+    results: dict[str, str] = {}
+    worker_cancel = _LinkedCancel(cancel_event)
+
+    def _assemble(language: str):
+        results[language] = _assemble_price_list(
+            language, prefixes[tokens[language]], _language_progress(language), worker_cancel, register_cleanup
+        )
+
+    with ThreadPoolExecutor(max_workers=len(languages), thread_name_prefix="wano-assemble") as executor:
+        _run_export_tasks(executor, [(_assemble, language) for language in languages], worker_cancel)
+
     if progress_cb:
         progress_cb("done", 100, "Gotowe")
-    return result
+    return {language: results[language] for language in languages}
 
 
 if __name__ == "__main__":
@@ -530,12 +1500,16 @@ if __name__ == "__main__":
 
     logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser(description="Generator cennika WANO (wersja web/CLI, libreoffice).")
-    parser.add_argument("--lang", choices=["pl", "en"], default="pl", help="Wybierz język PDF.")
+    parser.add_argument("--lang", choices=["pl", "en", "all"], default="pl", help="Wybierz język PDF.")
     parser.add_argument("--excel", default=None, help="Ścieżka do pliku Excela.")
     args = parser.parse_args()
 
     try:
-        output = generate_price_list(args.lang, args.excel)
-        print(f"✅ Wygenerowano: {output}")
+        if args.lang == "all":
+            for output in generate_price_lists(("pl", "en"), args.excel).values():
+                print(f"✅ Wygenerowano: {output}")
+        else:
+            output = generate_price_list(args.lang, args.excel)
+            print(f"✅ Wygenerowano: {output}")
     except GenerationError as exc:
         print(f"❌ {exc}")
@@ -23,18 +23,7 @@ document.getElementById('send-button').addEventListener('click', async function
 
         // Wyślij zapytanie do backendu
         try {
-            const response = await fetch('/chat', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: userInput })
-            });
-
-            if (!response.ok) {
-                throw new Error("Failed to fetch response from server");
-            }
-
-            const data = await response.json();
-            botMessage.innerText = data.response;
+            await streamChatResponse(userInput, botMessage, chatWindow);
         } catch (error) {
             botMessage.innerText = "Error: Could not fetch response.";
             console.error(error);
@@ -42,6 +31,30 @@ document.getElementById('send-button').addEventListener('click', async function
     }
 });
 
+// Odczytuje odpowiedź modelu token po tokenie (NDJSON z /chat/stream)
+async function streamChatResponse(text, botMessage, chatWindow) {
+    const response = await fetch('/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ text: text })
+    });
+
+    if (!response.ok) {
+        throw new Error("Failed to fetch response from server");
+    }
+
+    let received = '';
+    await readTokenStream(response, function (token) {
+        received += token;
+        botMessage.textContent = received;
+        chatWindow.scrollTop = chatWindow.scrollHeight;
+    });
+
+    if (!received) {
+        botMessage.textContent = "Model returned an empty response.";
+    }
+}
+
 document.addEventListener('keydown', function (event) {
     if (event.key === 'Enter') {
         document.getElementById('send-button').click();
@@ -73,18 +86,7 @@ document.getElementById('prompt2').addEventListener('click', async function () {
     chatWindow.scrollTop = chatWindow.scrollHeight;
 
     try {
-        const response = await fetch('/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text: "Short answer: What is machine learning?" })
-        });
-
-        if (!response.ok) {
-            throw new Error("Failed to fetch response from server");
-        }
-
-        const data = await response.json();
-        botMessage.textContent = data.response;
+        await streamChatResponse("Short answer: What is machine learning?", botMessage, chatWindow);
     } catch (error) {
         botMessage.textContent = "Error: Could not fetch response.";
         console.error(error);
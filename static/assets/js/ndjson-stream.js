@@ -0,0 +1,32 @@
+// Wspólny odczyt strumienia NDJSON ({"token": ...} / {"error": ...} w kolejnych liniach)
+// dla /chat/stream i /sleep/lesson/stream.
+async function readTokenStream(response, onToken) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    function handleLine(line) {
+        if (!line.trim()) {
+            return;
+        }
+        const chunk = JSON.parse(line);
+        if (chunk.error) {
+            throw new Error(chunk.error);
+        }
+        if (chunk.token) {
+            onToken(chunk.token);
+        }
+    }
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+}
@@ -185,7 +185,7 @@ function initSleepCoursePreview() {
 		generateBtn.textContent = 'Generating…';
 
 		try {
-			const response = await fetch('/sleep/lesson', {
+			const response = await fetch('/sleep/lesson/stream', {
 				method: 'POST',
 				headers: { 'Content-Type': 'application/json' },
 				body: JSON.stringify({
@@ -198,12 +198,22 @@ function initSleepCoursePreview() {
 				})
 			});
 
-			const payload = await response.json();
 			if (!response.ok) {
+				const payload = await response.json().catch(() => null);
 				throw new Error(payload?.detail || 'Failed to fetch lesson');
 			}
 
-			lessonEl.textContent = payload.lesson || payload.response || 'Model returned an empty lesson.';
+			let lesson = '';
+			lessonEl.textContent = '';
+			setStatus('Writing lesson…');
+			await readTokenStream(response, (token) => {
+				lesson += token;
+				lessonEl.textContent = lesson;
+			});
+
+			if (!lesson) {
+				lessonEl.textContent = 'Model returned an empty lesson.';
+			}
 			setStatus('Lesson generated successfully.');
 		} catch (error) {
 			console.error('Sleep lesson error', error);
@@ -219,6 +229,7 @@ function initSleepCoursePreview() {
 	setStatus('Enter your answers and click "Generate AI lesson".');
 	generateBtn.addEventListener('click', handleGenerateLesson);
 }
+
 document.addEventListener('DOMContentLoaded', () => {
 	initSleepModeToggle();
 	initSleepCoursePreview();
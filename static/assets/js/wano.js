@@ -6,6 +6,7 @@
 
     const plBtn = document.getElementById("generate-pl");
     const enBtn = document.getElementById("generate-en");
+    const allBtn = document.getElementById("generate-all");
     const dropzone = document.getElementById("wano-dropzone");
     const fileInput = document.getElementById("wano-file-input");
     const tableBody = document.getElementById("wano-table-body");
@@ -37,18 +38,23 @@
     const GEN_PROGRESS_INTERVAL = 3000; // 3 s na 1%
     const GEN_PROGRESS_MAX = 99;
     const GEN_TOTAL_MS = 300000; // 5 min
-    const STAGE_PRIORITY = { start: 0, export: 1, merge: 2, done: 3, error: 4 };
+    const STAGE_PRIORITY = { queued: 0, start: 1, export: 2, merge: 3, done: 4, error: 5 };
     const STAGE_TEXT = {
+        queued: "Oczekiwanie w kolejce...",
         start: "Przygotowanie pliku...",
         export: "Eksport arkuszy...",
         merge: "Scalanie PDF...",
         done: "Finalizowanie PDF...",
     };
+    let progressSource = null;
     let progressPoller = null;
-    const PROGRESS_POLL_INTERVAL = 2500;
+    const PROGRESS_POLL_INTERVAL = 2500; // tylko gdy przeglądarka nie obsługuje EventSource
     let genProgressTimer = null;
     let genProgressValue = 0;
     let currentGenLanguage = null;
+    let currentJobId = null;
+    const JOB_WAIT_SECONDS = 25;
+    const JOB_FINAL_STATUSES = ["done", "failed", "cancelled"];
     let generationActive = false;
     let genStartTime = null;
     let genTimerInterval = null;
@@ -61,6 +67,10 @@
     let progressStartMarker = 0;
     let pdfLibrary = [];
 
+    function languageLabel(language) {
+        return language === "all" ? "PL + EN" : language.toUpperCase();
+    }
+
     function formatDate(d = new Date()) {
         const pad = (v) => String(v).padStart(2, "0");
         return `${pad(d.getDate())}.${pad(d.getMonth() + 1)}.${d.getFullYear()} godz. ${pad(d.getHours())}:${pad(
@@ -255,7 +265,11 @@
         setTimeout(() => hideProgress(genProgressWrap), 400);
     }
 
-    function stopProgressPolling() {
+    function stopProgressUpdates() {
+        if (progressSource) {
+            progressSource.close();
+            progressSource = null;
+        }
         if (progressPoller) {
             clearInterval(progressPoller);
             progressPoller = null;
@@ -312,20 +326,20 @@
         }
 
         if (stage === "error") {
-            stopProgressPolling();
+            stopProgressUpdates();
             setStatus(`❌ ${payload.message || "Błąd generowania."}`, "error");
             return;
         }
 
         if (stage === "done") {
-            stopProgressPolling();
-            setStatus(`${language.toUpperCase()}: ${STAGE_TEXT.done}`);
+            stopProgressUpdates();
+            setStatus(`${languageLabel(language)}: ${STAGE_TEXT.done}`);
             finishGenProgress();
             return;
         }
 
         const label = STAGE_TEXT[stage] || stage;
-        setStatus(`${language.toUpperCase()}: ${label}`);
+        setStatus(`${languageLabel(language)}: ${label}`);
         if (genProgressWrap && genProgressWrap.hidden) {
             showProgress(genProgressWrap, genProgressFill, genProgressText, genProgressValue || 1);
         }
@@ -342,14 +356,29 @@
         }
     }
 
-    function startProgressPolling(language) {
-        stopProgressPolling();
-        pollProgress(language);
-        progressPoller = setInterval(() => pollProgress(language), PROGRESS_POLL_INTERVAL);
+    function startProgressUpdates(language) {
+        stopProgressUpdates();
+        if (!window.EventSource) {
+            pollProgress(language);
+            progressPoller = setInterval(() => pollProgress(language), PROGRESS_POLL_INTERVAL);
+            return;
+        }
+        // Serwer wysyła każdą zmianę postępu od razu (SSE), a na końcu zdarzenie done/error/cancelled
+        const source = new EventSource(`/api/wano/progress/${language}/stream`);
+        const onEvent = (event) => {
+            if (!event.data) return; // natywne "error" EventSource przy zerwaniu połączenia
+            try {
+                applyProgressPayload(JSON.parse(event.data), language);
+            } catch (err) {
+                console.error("Progress event error", err);
+            }
+        };
+        ["progress", "done", "error", "cancelled"].forEach((name) => source.addEventListener(name, onEvent));
+        progressSource = source;
     }
 
     function setLoading(isLoading) {
-        [plBtn, enBtn].forEach((btn) => {
+        [plBtn, enBtn, allBtn].forEach((btn) => {
             if (btn) btn.disabled = isLoading;
         });
         [downloadPlBtn, downloadEnBtn].forEach((btn) => {
@@ -385,7 +414,7 @@
 
     function resetGenerationUiState(options = {}) {
         const { resetCancelFlags = false } = options;
-        stopProgressPolling();
+        stopProgressUpdates();
         clearInterval(genProgressTimer);
         genProgressTimer = null;
         genProgressValue = 0;
@@ -409,15 +438,18 @@
 
     async function cancelGeneration(reason = "Generowanie przerwane.") {
         if (!generationActive || cancelInFlight) return;
+        const jobId = currentJobId;
+        const language = currentGenLanguage;
         cancelRequested = true;
         cancelInFlight = true;
         setStatus("Przerywam generowanie...");
         resetGenerationUiState();
         try {
-            await fetch("/api/wano/cancel", {
+            const url = jobId ? `/api/wano/jobs/${jobId}/cancel` : "/api/wano/cancel";
+            await fetch(url, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ language: currentGenLanguage, reason }),
+                body: JSON.stringify({ language, reason }),
             });
             setStatus("⏹️ Generowanie przerwane.");
         } catch (error) {
@@ -428,45 +460,78 @@
         }
     }
 
-    async function resetServerGenerationState() {
-        try {
-            await fetch("/api/wano/cancel", {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ reason: "Reset po odświeżeniu interfejsu" }),
-            });
-        } catch (err) {
-            console.warn("Reset cancel failed", err);
-        }
-    }
-
-    function sendCancelBeacon(language, reason) {
-        if (!navigator.sendBeacon) return false;
-        try {
-            const payload = JSON.stringify({ language, reason });
-            const blob = new Blob([payload], { type: "application/json" });
-            return navigator.sendBeacon("/api/wano/cancel", blob);
-        } catch (err) {
-            console.warn("sendBeacon cancel failed", err);
-            return false;
-        }
-    }
-
-    async function triggerGeneration(language) {
+    function beginGenerationUi(language) {
         setLoading(true);
-        setStatus(`Generuję cennik ${language.toUpperCase()}...`);
+        setStatus(`Generuję cennik ${languageLabel(language)}...`);
         genProgressValue = 1;
         startGenProgress();
-        startProgressPolling(language);
+        startProgressUpdates(language);
         generationActive = true;
         currentGenLanguage = language;
         startGenTimer();
         cancelRequested = false;
         cancelInFlight = false;
         toggleCancelButton(true);
+    }
+
+    function handleGenerationError(error) {
+        console.error(error);
+        const message = error instanceof Error ? error.message : "Wystąpił błąd.";
+        if (cancelRequested || message.toLowerCase().includes("przerwan")) {
+            setStatus(`⏹️ ${message}`);
+        } else {
+            setStatus(`❌ ${message}`, "error");
+        }
+    }
 
+    function finishGenerationUi() {
+        currentJobId = null;
+        if (cancelRequested) {
+            resetGenerationUiState({ resetCancelFlags: true });
+        } else {
+            stopProgressUpdates();
+            finishGenProgress();
+            setLoading(false);
+            generationActive = false;
+            currentGenLanguage = null;
+            updateGenTimer(0);
+            hideInfoForm();
+            toggleCancelButton(false);
+            cancelRequested = false;
+            cancelInFlight = false;
+        }
+    }
+
+    // Zadanie działa na serwerze niezależnie od karty - czekamy na wynik long-pollingiem
+    async function followJob(job) {
+        currentJobId = job.id;
+        let state = job;
+        while (!JOB_FINAL_STATUSES.includes(state.status)) {
+            const res = await fetch(`/api/wano/jobs/${job.id}?wait=${JOB_WAIT_SECONDS}`);
+            const payload = await res.json().catch(() => ({}));
+            if (!res.ok) {
+                throw new Error(payload.detail || "Nie udało się pobrać stanu zadania.");
+            }
+            state = payload;
+        }
+
+        if (state.status !== "done") {
+            throw new Error(state.error || "Generowanie przerwane.");
+        }
+        const result = state.result || {};
+        const filename = result.output || "Plik PDF";
+        setStatus(`✅ Gotowe: ${filename}`);
+        if (result.download) {
+            window.location.href = result.download;
+        }
+        await loadVersions();
+        await loadLatestPdfs();
+    }
+
+    async function triggerGeneration(language) {
+        beginGenerationUi(language);
         try {
-            const response = await fetch(`/api/wano/generate/${language}`, {
+            const response = await fetch(`/api/wano/jobs/${language}`, {
                 method: "POST",
             });
             const payload = await response.json().catch(() => ({}));
@@ -475,37 +540,36 @@
                 const detail = payload.detail || payload.message || "Błąd generowania.";
                 throw new Error(detail);
             }
-
-            const filename = payload.output || payload.file || payload.path || "Plik PDF";
-            setStatus(`✅ Gotowe: ${filename}`);
-            if (payload.download) {
-                window.location.href = payload.download;
+            if (payload.deduplicated) {
+                setStatus(`Cennik ${languageLabel(language)} jest już generowany - dołączam do zadania.`);
             }
-            await loadVersions();
-            await loadLatestPdfs();
+            await followJob(payload);
         } catch (error) {
-            console.error(error);
-            const message = error instanceof Error ? error.message : "Wystąpił błąd.";
-            if (cancelRequested || message.toLowerCase().includes("przerwan")) {
-                setStatus(`⏹️ ${message}`);
-            } else {
-                setStatus(`❌ ${message}`, "error");
-            }
+            handleGenerationError(error);
         } finally {
-            if (cancelRequested) {
-                resetGenerationUiState({ resetCancelFlags: true });
-            } else {
-                stopProgressPolling();
-                finishGenProgress();
-                setLoading(false);
-                generationActive = false;
-                currentGenLanguage = null;
-                updateGenTimer(0);
-                hideInfoForm();
-                toggleCancelButton(false);
-                cancelRequested = false;
-                cancelInFlight = false;
-            }
+            finishGenerationUi();
+        }
+    }
+
+    // Po odświeżeniu strony wracamy do śledzenia zadania, które nadal trwa
+    async function resumeActiveJob() {
+        let job = null;
+        try {
+            const res = await fetch("/api/wano/jobs?active=true");
+            const payload = await res.json().catch(() => ({}));
+            job = res.ok ? (payload.jobs || [])[0] : null;
+        } catch (err) {
+            console.warn("Active job lookup failed", err);
+        }
+        if (!job || generationActive) return;
+
+        beginGenerationUi(job.language);
+        try {
+            await followJob(job);
+        } catch (error) {
+            handleGenerationError(error);
+        } finally {
+            finishGenerationUi();
         }
     }
 
@@ -634,12 +698,8 @@
 
     plBtn?.addEventListener("click", () => triggerGeneration("pl"));
     enBtn?.addEventListener("click", () => triggerGeneration("en"));
+    allBtn?.addEventListener("click", () => triggerGeneration("all"));
     cancelBtn?.addEventListener("click", () => cancelGeneration("Generowanie przerwane przez użytkownika."));
-    window.addEventListener("beforeunload", () => {
-        if (generationActive && currentGenLanguage) {
-            sendCancelBeacon(currentGenLanguage, "Odświeżenie strony");
-        }
-    });
 
     dropzone?.addEventListener("click", () => fileInput?.click());
 
@@ -754,7 +814,7 @@
     }
 
     resetGenerationUiState({ resetCancelFlags: true });
-    resetServerGenerationState();
+    resumeActiveJob();
     loadVersions();
     loadLatestPdfs();
     loadPdfLibrary();
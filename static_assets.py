@@ -0,0 +1,413 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from jinja2 import Environment
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".ttf", ".otf", ".eot", ".json", ".map", ".txt", ".xml", ".ico", ".pdf"}
+# Sources, Python modules and the runtime WANO data directories are never served as assets.
+DEFAULT_EXCLUDE_DIRS = ("__pycache__", "sass", "wano")
+DEFAULT_EXCLUDE_EXTENSIONS = (".py", ".pyc", ".scss")
+DEFAULT_CACHE_DIR = os.environ.get("STATIC_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cache", "static"
+)
+_FINGERPRINT = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{12})(?P<ext>\.[^./]+)$")
+
+
+class Asset:
+    def __init__(self, rel: str, path: str, size: int, mtime_ns: int, sha256: str):
+        self.rel = rel
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+        stem, ext = os.path.splitext(rel)
+        self.fingerprinted = f"{stem}.{sha256[:12]}{ext}"
+        self.compressible = ext.lower() in COMPRESSIBLE_EXTENSIONS
+        self.media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        self.variants: Dict[str, str] = {}
+        self.tried: List[str] = []
+
+
+class AssetManifest:
+    """Content-hashed URLs and precompressed variants for the files of a static directory.
+
+    ``scan`` hashes every file (hashes are reused across restarts while size and mtime match) and
+    maps ``name.<hash>.ext`` URLs back to the files; it runs on the first lookup unless it was
+    called before, so constructing the manifest costs nothing at import time. ``compress`` writes gzip and, when the
+    optional ``brotli`` package is installed, brotli variants of compressible files into
+    ``cache_dir``. Variants are named after the content hash, so a changed file never reuses a
+    stale one, and are only kept when they save at least ``min_saving`` of the size.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        url_prefix: str = "/static",
+        exclude_dirs: Iterable[str] = DEFAULT_EXCLUDE_DIRS,
+        exclude_extensions: Iterable[str] = DEFAULT_EXCLUDE_EXTENSIONS,
+        min_size: int = 1024,
+        min_saving: float = 0.1,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.cache_dir = cache_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.exclude_dirs = set(exclude_dirs)
+        self.exclude_extensions = {ext.lower() for ext in exclude_extensions}
+        self.min_size = min_size
+        self.min_saving = min_saving
+        self.encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+        self._assets: Dict[str, Asset] = {}
+        self._by_fingerprint: Dict[str, Asset] = {}
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._scanned = False
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.cache_dir, "manifest.json")
+
+    def _load_previous(self) -> Dict[str, dict]:
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+            return previous if isinstance(previous, dict) else {}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self):
+        data = {
+            rel: {"size": asset.size, "mtime_ns": asset.mtime_ns, "sha256": asset.sha256, "tried": asset.tried}
+            for rel, asset in self._assets.items()
+        }
+        try:
+            _write_atomic(self._manifest_path, json.dumps(data).encode("utf-8"))
+        except OSError as exc:
+            logger.warning("Cannot save the static asset manifest %s: %s", self._manifest_path, exc)
+
+    def _files(self) -> Iterable[Tuple[str, str]]:
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = sorted(name for name in dirs if name not in self.exclude_dirs and not name.startswith("."))
+            for name in sorted(files):
+                if name.startswith(".") or os.path.splitext(name)[1].lower() in self.exclude_extensions:
+                    continue
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.directory).replace(os.sep, "/"), path
+
+    def _variant_path(self, sha256: str, encoding: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha256}.{'br' if encoding == 'br' else 'gz'}")
+
+    def _ensure_scanned(self):
+        if self._scanned:
+            return
+        with self._scan_lock:
+            if not self._scanned:
+                self.scan()
+
+    def scan(self) -> int:
+        previous = self._load_previous()
+        assets: Dict[str, Asset] = {}
+        for rel, path in self._files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cached = previous.get(rel) or {}
+            if cached.get("size") == stat.st_size and cached.get("mtime_ns") == stat.st_mtime_ns:
+                sha256 = cached["sha256"]
+            else:
+                sha256 = _hash_file(path)
+                cached = {}
+            asset = Asset(rel, path, stat.st_size, stat.st_mtime_ns, sha256)
+            asset.tried = list(cached.get("tried", []))
+            for encoding in asset.tried:
+                variant = self._variant_path(sha256, encoding)
+                if os.path.exists(variant):
+                    asset.variants[encoding] = variant
+            assets[rel] = asset
+
+        with self._lock:
+            self._assets = assets
+            self._by_fingerprint = {asset.fingerprinted: asset for asset in assets.values()}
+            self._scanned = True
+            self._save()
+        return len(assets)
+
+    def compress(self) -> int:
+        """Write missing compressed variants; returns the number of files written."""
+        self._ensure_scanned()
+        written = 0
+        for asset in list(self._assets.values()):
+            if not asset.compressible or asset.size < self.min_size:
+                continue
+            pending = [encoding for encoding in self.encodings if encoding not in asset.tried]
+            if not pending:
+                continue
+            try:
+                with open(asset.path, "rb") as f:
+                    data = f.read()
+            except OSError as exc:
+                logger.warning("Cannot read static asset %s: %s", asset.rel, exc)
+                continue
+            for encoding in pending:
+                body = _compress(data, encoding)
+                if len(body) <= len(data) * (1 - self.min_saving):
+                    variant = self._variant_path(asset.sha256, encoding)
+                    try:
+                        _write_atomic(variant, body)
+                    except OSError as exc:
+                        logger.warning("Cannot write %s variant of %s: %s", encoding, asset.rel, exc)
+                        return written
+                    asset.variants[encoding] = variant
+                    written += 1
+                asset.tried.append(encoding)
+        with self._lock:
+            self._save()
+        return written
+
+    def build(self) -> Tuple[int, int]:
+        return self.scan(), self.compress()
+
+    def url(self, rel: str) -> str:
+        """URL of a static file; content-hashed when the file is known to the manifest."""
+        self._ensure_scanned()
+        rel = rel.lstrip("/")
+        asset = self._assets.get(rel)
+        return f"{self.url_prefix}/{asset.fingerprinted if asset else rel}"
+
+    def version(self, rel: str) -> Optional[str]:
+        self._ensure_scanned()
+        asset = self._assets.get(rel.lstrip("/"))
+        return asset.sha256[:12] if asset else None
+
+    def lookup(self, rel: str) -> Tuple[Optional[Asset], bool]:
+        """Return (asset, fingerprinted) for a requested path relative to the static directory."""
+        self._ensure_scanned()
+        rel = rel.replace(os.sep, "/")
+        asset = self._by_fingerprint.get(rel)
+        if asset is not None:
+            return asset, True
+        asset = self._assets.get(rel)
+        if asset is None:
+            # An outdated hash (e.g. a page cached before a deploy) still gets the current file.
+            match = _FINGERPRINT.match(rel)
+            if match:
+                asset = self._assets.get(match.group("stem") + match.group("ext"))
+        return asset, False
+
+    def negotiate(self, asset: Asset, accept_encoding: str) -> Tuple[Optional[str], Optional[str]]:
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in self.encodings:
+            variant = asset.variants.get(encoding)
+            if variant and encoding in accepted:
+                return encoding, variant
+        return None, None
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles that serves fingerprinted URLs as immutable and picks precompressed variants."""
+
+    def __init__(self, *args, manifest: AssetManifest, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        asset, fingerprinted = self.manifest.lookup(path)
+        if asset is None:
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL} if fingerprinted else {}
+        file_path = asset.path
+        if asset.compressible:
+            headers["Vary"] = "Accept-Encoding"
+            # Byte ranges refer to the identity encoding (PDF viewers), so skip the variants then.
+            if "range" not in request_headers:
+                encoding, variant = self.manifest.negotiate(asset, request_headers.get("accept-encoding", ""))
+                if variant:
+                    file_path = variant
+                    headers["Content-Encoding"] = encoding
+        try:
+            stat_result = os.stat(file_path)
+        except FileNotFoundError:
+            return await super().get_response(asset.rel, scope)
+
+        response = FileResponse(
+            file_path,
+            headers=headers,
+            media_type=asset.media_type,
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class CachedPage:
+    def __init__(self, body: bytes, encodings: Dict[str, bytes], rendered: float):
+        self.body = body
+        self.encodings = encodings
+        self.rendered = rendered
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+
+class PageCache:
+    """Rendered HTML of Jinja templates that need no per-request context.
+
+    Pages are rendered once (``warm`` at startup, or on the first request) and kept in memory
+    together with their gzip/brotli bodies, so serving one is a dictionary lookup. A page is
+    rendered again when its template changes; Jinja's ``is_up_to_date`` is consulted at most
+    once per ``check_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        env: Environment,
+        check_interval: float = 1.0,
+        compress: bool = True,
+        cache_control: str = "no-cache",
+        min_size: int = 1024,
+    ):
+        self.env = env
+        self.check_interval = check_interval
+        self.encodings = (["br", "gzip"] if brotli is not None else ["gzip"]) if compress else []
+        self.cache_control = cache_control
+        self.min_size = min_size
+        self._pages: Dict[str, Tuple[object, CachedPage, float]] = {}
+        self._lock = threading.Lock()
+
+    def warm(self, names: Iterable[str]):
+        for name in names:
+            self.page(name)
+
+    def page(self, name: str) -> CachedPage:
+        now = time.monotonic()
+        entry = self._pages.get(name)
+        if entry is not None:
+            template, page, checked = entry
+            if now - checked < self.check_interval:
+                return page
+            if template.is_up_to_date:
+                self._pages[name] = (template, page, now)
+                return page
+        with self._lock:
+            entry = self._pages.get(name)
+            if entry is not None and entry[2] >= now and entry[0].is_up_to_date:
+                return entry[1]
+            template = self.env.get_template(name)
+            body = template.render().encode("utf-8")
+            encodings = {}
+            if len(body) >= self.min_size:
+                encodings = {encoding: _compress(body, encoding) for encoding in self.encodings}
+            page = CachedPage(body, encodings, time.time())
+            self._pages[name] = (template, page, time.monotonic())
+            return page
+
+    def response(self, name: str, request_headers: Headers) -> Response:
+        page = self.page(name)
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((encoding for encoding in self.encodings if encoding in accepted and encoding in page.encodings), None)
+        headers = {
+            "ETag": page.etag_for(encoding),
+            "Last-Modified": formatdate(page.rendered, usegmt=True),
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if _page_not_modified(page, request_headers):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(page.encodings.get(encoding, page.body), media_type="text/html", headers=headers)
+
+
+def _page_not_modified(page: CachedPage, request_headers: Headers) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # Any representation of the current render is still valid for the client.
+        current = {page.etag_for(encoding) for encoding in (None, *page.encodings)}
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or bool(current & tags)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(page.rendered) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    return brotli.compress(data, quality=11) if encoding == "br" else gzip.compress(data, 9, mtime=0)
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            accepted.add(name)
+    if "*" in accepted:
+        accepted.update({"br", "gzip"})
+    return accepted
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Hash and precompress static assets.")
+    parser.add_argument("directory", nargs="?", default="static")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+    manifest = AssetManifest(args.directory, args.cache_dir)
+    files, written = manifest.build()
+    print(f"{files} assets, {written} compressed variants written to {args.cache_dir}")